@@ -27,11 +27,10 @@ p = {
     "Toff": 1800,
     "dT": 120,
     "ox": True,  # 1. means True, switched on
-
-    "k": 10.0 ** 8.0 * 8,
+    "ps2cs": 0.525,  # constant input, no state variable
 }
 
-compounds = ["P700FA", "P700pFAm", "PC", "Fd", "ps2cs"]
+compounds = ["P700FA", "P700pFAm", "PC", "Fd"]
 
 def Keq_FAFd(E0_FA, F, E0_Fd, RT):
     DG1 = -E0_FA * F
@@ -53,6 +52,14 @@ def vPS1(P700FA, ps2cs, pfd):
     return (1 - ps2cs) * pfd * P700FA
 
 
+def electron_inventory(PCred, Fdred, P700FA, P700pFAm):
+    """
+    electrons in the system (one per reduced PC and Fd, one per P700FA and P700+FA-)
+    evaluated per time point, so it works on whole arrays of states
+    """
+    return PCred + Fdred + P700FA + P700pFAm
+
+
 def get_model():
     m = Model(parameters=p, compounds=compounds)
 
@@ -110,9 +117,9 @@ def get_model():
         rate_name="vPS1",
         function=vPS1,
         stoichiometry={"P700FA": -1, "P700pFAm": 1},
-        modifiers=["P700FA", "ps2cs"],  # redundant line, does not change the model, tested with and without and simulation results were identical
-        dynamic_variables=["P700FA", "ps2cs"],
-        parameters=["pfd"],
+        modifiers=["P700FA"],  # redundant line, does not change the model, tested with and without and simulation results were identical
+        dynamic_variables=["P700FA"],
+        parameters=["ps2cs", "pfd"],
     )
 
     m.add_reaction_from_args(
@@ -133,6 +140,13 @@ def get_model():
         args = ["P700pFA", "PCred", "P700FA", "PC", "kPCox", "Keq_PCP700"]
     )
 
+    m.add_algebraic_module(
+        module_name="electrons_alm",
+        function=electron_inventory,
+        compounds=["PCred", "Fdred", "P700FA", "P700pFAm"],
+        derived_compounds=["electrons"],
+    )
+
     # useful normalizations of concentrations ! 
     
     m.add_algebraic_module(
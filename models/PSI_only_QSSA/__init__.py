@@ -20,13 +20,13 @@ p = {
     "T": 298.0,  # Temperature in K - for now assumed to be constant at 25 C
     # light
     "pfd": 100.0,
+    "ps2cs": 0.525,  # constant input, no state variable (used to be kept constant by a pseudo reaction)
 
-    "k": 10.0 ** 8.0 * 8,
     "kMehler": 0,           # ! knocking out Mehler reaction
 }
 
 
-compounds = ["PC", "Fd", "ps2cs", "e_tot"]
+compounds = ["PC", "Fd"]
 
 def Keq_FAFd(E0_FA, F, E0_Fd, RT):
     DG1 = -E0_FA * F
@@ -92,34 +92,13 @@ def ps1analytic_mehler(PC, PCred, Fd, Fdred, ps2cs, PSItot, kFdred, KeqF, KeqC,
     return y0, y1, y2
 
 
-def electron_error(y0, y1, y2): # to test if error can be modeled using Delta of y0, y1, y2
+def electron_inventory(PCred, Fdred, P700FA, P700pFAm):
     """
-    Stores previous y0 as a function attribute to compute delta.
-    Will return 0 on first call.
-    y0 = P700FA
-    y1 = P700+FA-
-    y2 = P700+FA
+    electrons in the system, conserved as long as no electrons leave through the Mehler reaction
+    (one per reduced PC and Fd, one per P700FA (on P700) and P700+FA- (on FA), none on P700+FA)
+    evaluated per time point, so it works on whole arrays of states
     """
-
-    if not hasattr(electron_error, "y0_prev"): # if called the first time
-        electron_error.y0_prev = y0
-        electron_error.y1_prev = y1
-        electron_error.y2_prev = y2
-        return 0
-    
-    delta_y0 = y0 - electron_error.y0_prev
-    delta_y1 = y1 - electron_error.y1_prev
-    delta_y2 = y2 - electron_error.y2_prev
-
-    d_electrons_dt = 1*delta_y0 + 1*delta_y1 + 0*delta_y2
-
-    #print(f"delta_y0: {delta_y0}, delta_y1: {delta_y1}, delta_y2: {delta_y2}, d_electrons_dt: {d_electrons_dt}")
-
-    # remember current values for the next call
-    electron_error.y0_prev = y0
-    electron_error.y1_prev = y1
-    electron_error.y2_prev = y2
-    return d_electrons_dt
+    return PCred + Fdred + P700FA + P700pFAm
 
 
 def vFd_red(Fd, Fdred, P700pFAm, P700pFA, kFdred, Keq_FAFd):
@@ -178,9 +157,10 @@ def get_model():
     m.add_algebraic_module(
         module_name="ps1states",
         function=ps1analytic_mehler,
-        compounds=["PC", "PCred", "Fd", "Fdred", "ps2cs"], #removed "LHC" (see below)
+        compounds=["PC", "PCred", "Fd", "Fdred"], #removed "LHC" (see below)
         derived_compounds=["P700FA", "P700pFAm", "P700pFA"],
         parameters=[
+            "ps2cs",
             "PSItot",
             "kFdred",
             "Keq_FAFd",
@@ -212,9 +192,9 @@ def get_model():
         rate_name="vPS1",
         function=vPS1,
         stoichiometry={"PC": 1},
-        modifiers=["P700FA", "ps2cs"],
-        dynamic_variables=["P700FA", "ps2cs"],
-        parameters=["pfd"],
+        modifiers=["P700FA"],
+        dynamic_variables=["P700FA"],
+        parameters=["ps2cs", "pfd"],
     )
 
     m.add_reaction(
@@ -225,21 +205,11 @@ def get_model():
         parameters=["kFdred", "Keq_FAFd"],
     )
 
-    m.add_reaction(
-        rate_name="vPS1_electron_error",
-        function=electron_error,
-        stoichiometry={"e_tot": 0}, # ! 0 cause for some reason I dont understand this crashes the whole system!
-        args=["P700FA", "P700pFAm", "P700pFA"]
-    )
-
-    # pseudo reaction to "update" "ps2cs" variable but keeps it constant
-    m.add_reaction(
-        rate_name="vps2cs",
-        function=proportional,
-        stoichiometry={"ps2cs": 0},
-        modifiers=["ps2cs"],
-        dynamic_variables=["ps2cs"],
-        parameters=["k"],
+    m.add_algebraic_module(
+        module_name="electrons_alm",
+        function=electron_inventory,
+        compounds=["PCred", "Fdred", "P700FA", "P700pFAm"],
+        derived_compounds=["electrons"],
     )
 
     # useful normalizations of concentrations ! 
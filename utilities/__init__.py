@@ -0,0 +1,6 @@
+"""Project specific simulation utilities used by the analyses notebooks."""
+
+from .events import Event, Extremum, Threshold
+from .integrator import StepIntegrator
+from .reducers import Integral, Last, Maximum, Minimum, Reducer, TimeAverage
+from .simulator import SegmentSimulator, Simulator
@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+__all__ = ["ArtifactStore", "model_hash", "content_hash"]
+
+import hashlib
+import inspect
+import io
+import json
+import os
+import stat
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Union
+
+import pandas as pd
+from modelbase.ode import Model
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _function_source(function: Callable) -> str:
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        code = getattr(function, "__code__", None)
+        if code is None:
+            return repr(function)
+        return code.co_code.hex() + repr(code.co_consts)
+
+
+def model_hash(model: Model) -> str:
+    """
+    Hash of everything that determines a simulation of the model.
+
+    Covers parameters, compounds, stoichiometries and the source of all rate, algebraic
+    module and derived parameter functions, so changes made in a notebook (e.g.
+    update_parameter("kcyc", 0)) give a different hash than the model file alone.
+    """
+    description = {
+        "compounds": model.get_compounds(),
+        "parameters": {k: repr(v) for k, v in sorted(model.get_parameters().items())},
+        "stoichiometries": {k: v for k, v in sorted(model.stoichiometries.items())},
+        "rates": {
+            name: [_function_source(rate.function), rate.args]
+            for name, rate in sorted(model.rates.items())
+        },
+        "algebraic_modules": {
+            name: [
+                _function_source(module.function),
+                module.args,
+                module.derived_compounds,
+            ]
+            for name, module in sorted(model.algebraic_modules.items())
+        },
+        "derived_parameters": {
+            name: [_function_source(dp["function"]), dp["parameters"]]
+            for name, dp in sorted(model.derived_parameters.items())
+        },
+    }
+    return content_hash(json.dumps(description, sort_keys=True, default=str).encode())
+
+
+class ArtifactStore:
+    """
+    Content addressed store for results and figures.
+
+    Every written version is kept once as a read-only objects/<hash> and the file
+    at its usual place (e.g. data/latest_dev/PAM/c.joblib) is a copy of it, so
+    writing to that file by other means (joblib.dump, savefig) never touches the
+    stored versions. The versions of a path are kept as a list of hashes plus
+    metadata (model hash, protocol, ...) in refs/.
+    Results computed through get_or_compute are additionally indexed by the hash of
+    model and protocol and served from the store when requested again.
+    """
+
+    def __init__(self, root: Union[str, Path] = "data/.store") -> None:
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.refs = self.root / "refs"
+        self.cache = self.root / "cache"
+        for folder in (self.objects, self.refs, self.cache):
+            folder.mkdir(parents=True, exist_ok=True)
+
+    ##########################################################################
+    # Blobs
+    ##########################################################################
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects / digest[:2] / digest
+
+    def put_bytes(self, data: bytes) -> str:
+        digest = content_hash(data)
+        path = self._object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, path)
+        return digest
+
+    def get_bytes(self, digest: str) -> bytes:
+        data = self._object_path(digest).read_bytes()
+        if content_hash(data) != digest:
+            raise ValueError(f"Stored object {digest} is corrupted")
+        return data
+
+    ##########################################################################
+    # Paths with version history
+    ##########################################################################
+
+    def _ref_path(self, path: Union[str, Path]) -> Path:
+        return self.refs / (
+            Path(os.path.relpath(path)).as_posix().replace("/", "__") + ".json"
+        )
+
+    def _read_ref(self, path: Union[str, Path]) -> Dict[str, Any]:
+        ref = self._ref_path(path)
+        if ref.exists():
+            return json.loads(ref.read_text())
+        return {"path": Path(os.path.relpath(path)).as_posix(), "versions": []}
+
+    def _checkout(self, digest: str, path: Union[str, Path]) -> None:
+        # a copy, never a link: the working file may be overwritten in place
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(self.get_bytes(digest))
+        os.replace(tmp, path)
+
+    def put(
+        self,
+        path: Union[str, Path],
+        data: bytes,
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Write data to path and record it as the newest version of path"""
+        digest = self.put_bytes(data)
+        self._checkout(digest, path)
+        ref = self._read_ref(path)
+        if not ref["versions"] or ref["versions"][-1]["hash"] != digest:
+            ref["versions"].append(
+                {
+                    "hash": digest,
+                    "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    **(meta or {}),
+                }
+            )
+            self._ref_path(path).write_text(json.dumps(ref, indent=1, default=str))
+        return digest
+
+    def history(self, path: Union[str, Path]) -> pd.DataFrame:
+        return pd.DataFrame(self._read_ref(path)["versions"])
+
+    def restore(self, path: Union[str, Path], version: int = -2) -> str:
+        """Make an older version (index into history, default the previous one) current"""
+        entry = self._read_ref(path)["versions"][version]
+        return self.put(
+            path, self.get_bytes(entry["hash"]), meta={"restored": entry["hash"]}
+        )
+
+    ##########################################################################
+    # Python objects
+    ##########################################################################
+
+    @staticmethod
+    def _dumps(obj: Any) -> bytes:
+        import joblib
+
+        buffer = io.BytesIO()
+        joblib.dump(obj, buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _loads(data: bytes) -> Any:
+        import joblib
+
+        return joblib.load(io.BytesIO(data))
+
+    def dump(
+        self,
+        obj: Any,
+        path: Union[str, Path],
+        meta: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        return self.put(path, self._dumps(obj), meta=meta)
+
+    def load(self, path: Union[str, Path], version: Optional[int] = None) -> Any:
+        if version is None:
+            return self._loads(Path(path).read_bytes())
+        return self._loads(
+            self.get_bytes(self._read_ref(path)["versions"][version]["hash"])
+        )
+
+    ##########################################################################
+    # Cache
+    ##########################################################################
+
+    @staticmethod
+    def cache_key(model: Optional[Model], protocol: Dict[str, Any]) -> str:
+        description = {
+            "model": None if model is None else model_hash(model),
+            "protocol": protocol,
+        }
+        return content_hash(json.dumps(description, sort_keys=True, default=str).encode())
+
+    def get_or_compute(
+        self,
+        compute: Callable[[], Any],
+        model: Optional[Model] = None,
+        protocol: Optional[Dict[str, Any]] = None,
+        path: Optional[Union[str, Path]] = None,
+    ) -> Any:
+        """
+        Return the stored result of an identical earlier run or compute (and store) it.
+
+        protocol should name everything compute depends on besides the model, e.g.
+        {"name": "PAM", "t_relax": 120, "pfd_pulse": 5000}.
+        """
+        protocol = {} if protocol is None else protocol
+        key = self.cache_key(model, protocol)
+        entry = self.cache / f"{key}.json"
+        if entry.exists():
+            digest = json.loads(entry.read_text())["hash"]
+            try:
+                data = self.get_bytes(digest)
+            except (OSError, ValueError):
+                data = None  # missing or corrupted, compute again
+            if data is not None:
+                if path is not None:
+                    self._checkout(digest, path)
+                return self._loads(data)
+
+        obj = compute()
+        data = self._dumps(obj)
+        meta = {
+            "model_hash": None if model is None else model_hash(model),
+            "protocol": protocol,
+        }
+        if path is None:
+            digest = self.put_bytes(data)
+        else:
+            digest = self.put(path, data, meta=meta)
+        entry.write_text(json.dumps({"hash": digest, **meta}, indent=1, default=str))
+        return obj
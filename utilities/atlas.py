@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+__all__ = ["SteadyStateAtlas", "get_atlas"]
+
+import logging
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Union
+
+import numpy as np
+from modelbase.ode import Model
+from scipy.interpolate import RegularGridInterpolator
+
+from .artifacts import ArtifactStore, model_hash
+from .conservation import ReducedSystem
+from .linearization import model_jacobian
+from .parameters import incremental_derived_parameters, update_parameters
+from .protocols import Y0
+
+logger = logging.getLogger(__name__)
+
+
+class SteadyStateAtlas:
+    """
+    Steady states of a model on a grid of parameters (pfd, and e.g. CO2, O2ext).
+
+    Concentrations are interpolated log-linearly between the grid points, so a
+    warm start for any parameter value inside the grid is there in microseconds;
+    steady_state refines it to the exact steady state with a few Newton steps.
+    The atlas does not keep the model, only its hash, and pickles small.
+
+        atlas = SteadyStateAtlas.build(m, {"pfd": np.geomspace(5, 3000, 40)})
+        y0 = atlas.interpolate(pfd=100)
+        y_ss = atlas.steady_state(m, pfd=100)
+    """
+
+    def __init__(
+        self,
+        axes: Dict[str, np.ndarray],
+        compounds: Sequence[str],
+        states: np.ndarray,
+        fixed: Dict[str, float],
+        model_hash: str,
+    ) -> None:
+        self.axes = {k: np.asarray(v, dtype=float) for k, v in axes.items()}
+        self.compounds = list(compounds)
+        self.states = np.asarray(states, dtype=float)
+        self.fixed = dict(fixed)
+        self.model_hash = model_hash
+        self._interpolator: Optional[RegularGridInterpolator] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {**self.__dict__, "_interpolator": None}
+
+    ##########################################################################
+    # Building
+    ##########################################################################
+
+    @staticmethod
+    def _hash(model: Model, fixed: Dict[str, float]) -> str:
+        # the grid parameters do not count, whatever they are set to now
+        model = model.copy()
+        model.update_parameters(fixed)
+        return model_hash(model)
+
+    @classmethod
+    def build(
+        cls,
+        model: Model,
+        grid: Dict[str, Sequence[float]],
+        y0: Optional[Dict[str, float]] = None,
+    ) -> "SteadyStateAtlas":
+        """
+        Steady states at every grid point.
+
+        The walk starts at the grid point closest to the model's current parameters
+        (from y0, default Y0) and spreads out from there, every point starting from
+        the closest finished one (see _solve). Points without a steady state stay
+        NaN.
+        """
+        axes = {k: np.sort(np.asarray(v, dtype=float)) for k, v in grid.items()}
+        fixed = {k: model.get_parameter(k) for k in axes}
+        compounds = model.get_compounds()
+        shape = tuple(len(v) for v in axes.values())
+        states = np.full((*shape, len(compounds)), np.nan)
+        m = model.copy()
+        incremental_derived_parameters(m)
+        y = dict(Y0 if y0 is None else y0)
+        y = {c: y.get(c, 1.0) for c in compounds}
+
+        # grid points ordered by their (index) distance to the start
+        start = [int(np.argmin(np.abs(v - fixed[k]))) for k, v in axes.items()]
+        points = np.array(list(np.ndindex(*shape)))
+        points = points[np.argsort(np.abs(points - start).sum(axis=1), kind="stable")]
+        done = np.zeros(len(points), dtype=bool)
+        names = list(axes)
+        for k, index in enumerate(points):
+            index = tuple(index)
+            if done.any():
+                distance = np.abs(points[done] - index).sum(axis=1)
+                closest = tuple(points[done][np.argmin(distance)])
+                y = dict(zip(compounds, states[closest]))
+            update_parameters(m, {name: axes[name][i] for name, i in zip(names, index)})
+            y_ss = _solve(m, y)
+            if y_ss is None:
+                logger.warning(
+                    "No steady state at %s",
+                    {name: axes[name][i] for name, i in zip(names, index)},
+                )
+                continue
+            states[index] = [y_ss[c] for c in compounds]
+            done[k] = True
+        return cls(axes, compounds, states, fixed, cls._hash(model, fixed))
+
+    ##########################################################################
+    # Lookup
+    ##########################################################################
+
+    def matches(self, model: Model) -> bool:
+        """True if the atlas was built for this model (grid parameters aside)"""
+        return self.compounds == model.get_compounds() and (
+            self._hash(model, self.fixed) == self.model_hash
+        )
+
+    def _point(self, parameters: Dict[str, float]) -> np.ndarray:
+        unknown = set(parameters).difference(self.axes)
+        if unknown:
+            raise KeyError(f"Not parameters of the atlas: {sorted(unknown)}")
+        point = []
+        for name, grid in self.axes.items():
+            value = float(parameters.get(name, self.fixed[name]))
+            if not grid[0] <= value <= grid[-1]:
+                logger.warning(
+                    "%s=%g outside the atlas (%g to %g)", name, value, grid[0], grid[-1]
+                )
+            point.append(np.clip(value, grid[0], grid[-1]))
+        return np.array(point)
+
+    def interpolate(self, **parameters: float) -> Dict[str, float]:
+        """
+        Interpolated steady state, a warm start for parameters inside the grid.
+
+        Grid parameters not given are taken at the value the model had when the
+        atlas was built.
+        """
+        if self._interpolator is None:
+            log_states = np.log(np.maximum(self.states, np.finfo(float).tiny))
+            self._interpolator = RegularGridInterpolator(
+                tuple(self.axes.values()), log_states, method="linear"
+            )
+        point = self._point(parameters)
+        y = np.exp(self._interpolator(point)[0])
+        if not np.all(np.isfinite(y)):
+            # a failed grid point next to it, take the closest finished one
+            y = self._nearest(point)
+        return dict(zip(self.compounds, y))
+
+    def _nearest(self, point: np.ndarray) -> np.ndarray:
+        grids = np.meshgrid(*self.axes.values(), indexing="ij")
+        spans = [g[-1] - g[0] or 1.0 for g in self.axes.values()]
+        distance = sum(((g - p) / s) ** 2 for g, p, s in zip(grids, point, spans))
+        distance[~np.all(np.isfinite(self.states), axis=-1)] = np.inf
+        return self.states[np.unravel_index(np.argmin(distance), distance.shape)]
+
+    def steady_state(
+        self, model: Model, **parameters: float
+    ) -> Optional[Dict[str, float]]:
+        """
+        Exact steady state of model at parameters, refined from the interpolation.
+
+        The model is not changed. None if neither Newton nor simulation converge.
+        """
+        if not self.matches(model):
+            logger.warning("The atlas was built for a different model")
+        m = model.copy()
+        update_parameters(m, {k: float(v) for k, v in parameters.items()})
+        return _solve(m, self.interpolate(**parameters))
+
+
+def _newton(m: Model, y: Dict[str, float]) -> Optional[Dict[str, float]]:
+    # only non-negative, stable roots count
+    y_ss = ReducedSystem(m, y).steady_state()
+    if y_ss is None or min(y_ss.values()) < -1e-9:
+        return None
+    if np.max(np.linalg.eigvals(model_jacobian(m, y_ss)).real) > 1e-9:
+        return None
+    return y_ss
+
+
+def _solve(
+    m: Model,
+    y: Dict[str, float],
+    t_end: float = 1e4,
+    max_rounds: int = 5,
+    tolerance: float = 1e-6,
+) -> Optional[Dict[str, float]]:
+    """
+    Steady state of m close to y: Newton's method, and if that fails or lands on a
+    negative or unstable state, rounds of integrating for t_end (BDF) followed by
+    Newton again, until Newton converges or max |dy/dt| drops below tolerance. At
+    low light a near zero eigenvalue (Vx) keeps Newton from converging for a while.
+    """
+    y_ss = _newton(m, y)
+    for _ in range(max_rounds):
+        if y_ss is not None:
+            return y_ss
+        r = ReducedSystem(m, y)
+        t, Y = r.integrate(t_end, rtol=1e-6, atol=1e-9)
+        if t is None:
+            return None
+        y = dict(zip(r.compounds, Y[-1]))
+        if np.max(np.abs(r.rhs(0, r.reduce(Y[-1])))) < tolerance:
+            return y
+        y_ss = _newton(m, y)
+    return y_ss
+
+
+def get_atlas(
+    model: Model,
+    model_name: str,
+    grid: Optional[Dict[str, Sequence[float]]] = None,
+    root: Union[str, Path] = "data",
+    store: Optional[ArtifactStore] = None,
+) -> SteadyStateAtlas:
+    """
+    The atlas of a model variant, from data/<model_name>/steady_state_atlas.joblib.
+
+    Built (default grid: 40 pfd values from 5 to 3000, log spaced) and stored
+    the first time, and rebuilt whenever the model or the grid changes.
+    """
+    if grid is None:
+        grid = {"pfd": np.geomspace(5, 3000, 40)}
+    store = ArtifactStore() if store is None else store
+    protocol = {
+        "name": "steady_state_atlas",
+        "grid": {k: [float(v) for v in values] for k, values in grid.items()},
+    }
+    reference = model.copy()
+    reference.update_parameters({k: float(np.min(v)) for k, v in grid.items()})
+    return store.get_or_compute(
+        lambda: SteadyStateAtlas.build(model, grid),
+        model=reference,
+        protocol=protocol,
+        path=Path(root) / model_name / "steady_state_atlas.joblib",
+    )
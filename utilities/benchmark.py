@@ -0,0 +1,225 @@
+"""
+Benchmarks of all model variants under models/.
+
+    python -m utilities.benchmark
+    python -m utilities.benchmark --models latest_dev new_PSI --tasks construction rhs
+
+Every run is appended to data/benchmarks/history.csv (one row per model and task)
+and compared to the median of the earlier successful runs of the same model and task.
+Runs slower than that by more than --threshold are reported as regressions and make
+the command exit with status 1.
+"""
+
+from __future__ import annotations
+
+__all__ = ["TASKS", "find_models", "run_benchmarks", "compare_to_history", "main"]
+
+import argparse
+import importlib
+import subprocess
+import sys
+import time
+import warnings
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model, Simulator
+
+from .protocols import Y0, get_stst_y0, pam_analysis, pfd_ss_scan, pirk
+
+HISTORY = Path("data/benchmarks/history.csv")
+
+
+def _load(model_name: str) -> Model:
+    return importlib.import_module(f"models.{model_name}").get_model()
+
+
+def _state(m: Model) -> np.ndarray:
+    return np.array([Y0.get(c, 1.0) for c in m.get_compounds()])
+
+
+# Every task gets the model name and returns the function that is timed,
+# so the setup (e.g. finding the initial steady state) is not part of the timing.
+def _construction(name: str) -> Callable[[], Any]:
+    module = importlib.import_module(f"models.{name}")
+    return module.get_model
+
+
+def _rhs(name: str, n: int = 100) -> Callable[[], Any]:
+    m = _load(name)
+    y = _state(m)
+
+    def run() -> None:
+        for _ in range(n):
+            m._get_rhs(0, y)
+
+    return run
+
+
+def _fluxes(name: str, n: int = 100) -> Callable[[], Any]:
+    m = _load(name)
+    y = dict(zip(m.get_compounds(), _state(m)))
+
+    def run() -> None:
+        for _ in range(n):
+            m.get_fluxes_dict(y, 0)
+
+    return run
+
+
+def _stst_y0(name: str) -> Callable[[], Any]:
+    m = _load(name)
+    return lambda: _check(get_stst_y0(m))
+
+
+def _pam(name: str) -> Callable[[], Any]:
+    m = _load(name)
+    y0 = _check(get_stst_y0(m, pfd=70))
+    s = Simulator(m)
+    s.initialise(y0)
+    return lambda: _finite(*pam_analysis(s))
+
+
+def _pirk(name: str) -> Callable[[], Any]:
+    m = _load(name)
+    # 8 pulses as in PIRK.ipynb, the benchmark history is based on them
+    return lambda: _finite(*pirk(Simulator(m), number_of_pulses=8))
+
+
+def _pfd_scan(name: str) -> Callable[[], Any]:
+    m = _load(name)
+    y0 = _check(get_stst_y0(m))
+    return lambda: pfd_ss_scan(Simulator(m), np.linspace(30, 1750, 20), y0)
+
+
+def _check(y0: Optional[Dict[str, float]]) -> Dict[str, float]:
+    if y0 is None:
+        raise ValueError("No steady state found")
+    return y0
+
+
+def _finite(c: pd.DataFrame, v: pd.DataFrame) -> None:
+    # a failed integration is fast, but not a result
+    if not (np.isfinite(c.to_numpy()).all() and np.isfinite(v.to_numpy()).all()):
+        raise ValueError("Simulation returned non-finite values")
+
+
+TASKS: Dict[str, Callable[[str], Callable[[], Any]]] = {
+    "construction": _construction,
+    "rhs": _rhs,
+    "fluxes": _fluxes,
+    "stst_y0": _stst_y0,
+    "pam": _pam,
+    "pirk": _pirk,
+    "pfd_scan": _pfd_scan,
+}
+
+
+def find_models(root: str = "models") -> List[str]:
+    return sorted(p.parent.name for p in Path(root).glob("*/__init__.py"))
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run_benchmarks(
+    models: Optional[List[str]] = None,
+    tasks: Optional[List[str]] = None,
+    repeat: int = 1,
+) -> pd.DataFrame:
+    """
+    Best-of-repeat wall time in seconds for every model and task.
+
+    Failures are recorded, not raised.
+    """
+    if models is None:
+        models = find_models()
+    if tasks is None:
+        tasks = list(TASKS)
+    run = time.strftime("%Y-%m-%dT%H:%M:%S")
+    revision = _git_revision()
+    rows = []
+    for model_name in models:
+        for task in tasks:
+            row = {"run": run, "revision": revision, "model": model_name, "task": task}
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    timings = []
+                    for _ in range(repeat):
+                        func = TASKS[task](model_name)
+                        start = time.perf_counter()
+                        func()
+                        timings.append(time.perf_counter() - start)
+                row.update({"seconds": min(timings), "status": "ok", "error": ""})
+            except Exception as e:
+                row.update(
+                    {"seconds": np.nan, "status": "failed", "error": repr(e)[:200]}
+                )
+            ok = row["status"] == "ok"
+            result = f"{row['seconds']:10.4f} s" if ok else row["error"]
+            print(f"{model_name:>20} {task:>12} {result}", flush=True)
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def compare_to_history(
+    results: pd.DataFrame,
+    history: pd.DataFrame,
+    threshold: float = 0.25,
+) -> pd.DataFrame:
+    """Ratio to the median of earlier successful runs, regression above 1 + threshold"""
+    ok = history[history["status"] == "ok"]
+    baseline = ok.groupby(["model", "task"])["seconds"].median().rename("baseline")
+    compared = results.join(baseline, on=["model", "task"])
+    compared["ratio"] = compared["seconds"] / compared["baseline"]
+    compared["regression"] = compared["ratio"] > 1 + threshold
+    return compared
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--models", nargs="*", default=None)
+    parser.add_argument("--tasks", nargs="*", default=None, choices=list(TASKS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--history", type=Path, default=HISTORY)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(models=args.models, tasks=args.tasks, repeat=args.repeat)
+    if args.history.exists():
+        history = pd.read_csv(args.history)
+    else:
+        history = results.iloc[:0]
+    compared = compare_to_history(results, history, threshold=args.threshold)
+
+    args.history.parent.mkdir(parents=True, exist_ok=True)
+    pd.concat([history, results]).to_csv(args.history, index=False)
+
+    regressions = compared[compared["regression"]]
+    for _, row in regressions.iterrows():
+        print(
+            f"REGRESSION {row['model']} {row['task']}: "
+            f"{row['seconds']:.4f} s vs {row['baseline']:.4f} s ({row['ratio']:.2f}x)"
+        )
+    newly_failed = compared[
+        (compared["status"] == "failed") & compared["baseline"].notna()
+    ]
+    for _, row in newly_failed.iterrows():
+        print(f"FAILED {row['model']} {row['task']} (worked before): {row['error']}")
+    return int(len(regressions) > 0 or len(newly_failed) > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
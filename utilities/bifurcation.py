@@ -0,0 +1,420 @@
+from __future__ import annotations
+
+__all__ = ["continuation", "bifurcation_curve"]
+
+import logging
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+
+from .conservation import ReducedSystem
+from .linearization import _steps
+from .parameters import incremental_derived_parameters, update_parameters
+
+logger = logging.getLogger(__name__)
+
+
+class _Equilibria:
+    """rhs of the reduced model as a function of the state and some parameters"""
+
+    def __init__(self, model: Model, y0: Any, parameters: Sequence[str]) -> None:
+        model = model.copy()
+        incremental_derived_parameters(model)
+        self.r = ReducedSystem(model, y0)
+        self.parameters = list(parameters)
+
+    @property
+    def n(self) -> int:
+        return len(self.r.independent)
+
+    def _set(self, p: np.ndarray) -> None:
+        update_parameters(self.r.model, dict(zip(self.parameters, p)))
+
+    def f(self, x: np.ndarray, p: np.ndarray) -> np.ndarray:
+        self._set(p)
+        return self.r.rhs(0, x)
+
+    def jac_x(self, x: np.ndarray, p: np.ndarray) -> np.ndarray:
+        self._set(p)
+        return self.r.jacobian(0, x)
+
+    def jac_p(self, x: np.ndarray, p: np.ndarray) -> np.ndarray:
+        h = _steps(p)
+        columns = []
+        for i in range(len(p)):
+            dp = np.zeros_like(p)
+            dp[i] = h[i]
+            columns.append((self.f(x, p + dp) - self.f(x, p - dp)) / (2 * h[i]))
+        return np.column_stack(columns)
+
+
+# test functions, zero at the bifurcation
+
+
+def _fold_test(J: np.ndarray, b: np.ndarray, c: np.ndarray) -> float:
+    # bordered system [[J, b], [c^T, 0]] [v, s] = [0, 1]: s = 0 exactly where J is
+    # singular and, unlike det(J), smooth and well scaled
+    n = len(J)
+    A = np.block([[J, b[:, None]], [c[None, :], np.zeros((1, 1))]])
+    rhs = np.zeros(n + 1)
+    rhs[-1] = 1
+    return float(np.linalg.solve(A, rhs)[-1])
+
+
+def _hopf_test(J: np.ndarray) -> float:
+    # real part of the complex pair closest to the imaginary axis
+    lam = np.linalg.eigvals(J)
+    pairs = lam[lam.imag > 1e-9 * np.maximum(1, np.abs(lam))]
+    if len(pairs) == 0:
+        return np.nan
+    return float(pairs[np.argmin(np.abs(pairs.real))].real)
+
+
+def _stability(J: np.ndarray) -> Tuple[float, int, int]:
+    lam = np.linalg.eigvals(J)
+    unstable = lam.real > 0
+    return (
+        float(lam.real.max()),
+        int(unstable.sum()),
+        int((unstable & (lam.imag != 0)).sum()),
+    )
+
+
+# pseudo-arclength continuation of F(z) = 0, F: R^(m+1) -> R^m, in scaled coordinates
+
+
+class _Curve:
+    def __init__(
+        self,
+        F: Callable[[np.ndarray], np.ndarray],
+        jac: Callable[[np.ndarray], np.ndarray],
+        scale: np.ndarray,
+        tol: float = 1e-9,
+        max_iter: int = 8,
+    ) -> None:
+        self.F, self.jac, self.scale = F, jac, scale
+        self.tol, self.max_iter = tol, max_iter
+
+    def J(self, u: np.ndarray) -> np.ndarray:
+        return self.jac(u * self.scale) * self.scale
+
+    def tangent(self, u: np.ndarray, previous: np.ndarray) -> np.ndarray:
+        A = np.vstack([self.J(u), previous])
+        rhs = np.zeros(len(u))
+        rhs[-1] = 1
+        t = np.linalg.solve(A, rhs)
+        t /= np.linalg.norm(t)
+        return t if t @ previous >= 0 else -t
+
+    def correct(
+        self, u: np.ndarray, normal: np.ndarray, anchor: np.ndarray
+    ) -> Tuple[Optional[np.ndarray], int]:
+        """Newton on F = 0 within the hyperplane through anchor orthogonal to normal"""
+        for iteration in range(1, self.max_iter + 1):
+            G = np.append(self.F(u * self.scale), normal @ (u - anchor))
+            try:
+                du = np.linalg.solve(np.vstack([self.J(u), normal]), -G)
+            except np.linalg.LinAlgError:
+                return None, iteration
+            u = u + du
+            if not np.all(np.isfinite(u)):
+                return None, iteration
+            if np.max(np.abs(du)) < self.tol:
+                return u, iteration
+        return None, self.max_iter
+
+    def run(
+        self,
+        u: np.ndarray,
+        t: np.ndarray,
+        ds: float,
+        ds_min: float,
+        ds_max: float,
+        max_steps: int,
+        keep: Callable[[np.ndarray], bool],
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        points, tangents = [u], [t]
+        while len(points) <= max_steps:
+            prediction = u + ds * t
+            corrected, iterations = self.correct(prediction, t, prediction)
+            # a corrector that lands far from the prediction jumped to another branch
+            if corrected is None or np.linalg.norm(corrected - prediction) > ds:
+                ds /= 2
+                if ds < ds_min:
+                    logger.info("continuation stopped, step below %.2g", ds_min)
+                    break
+                continue
+            if not keep(corrected * self.scale):
+                break
+            t = self.tangent(corrected, t)
+            u = corrected
+            points.append(u)
+            tangents.append(t)
+            if iterations <= 3:
+                ds = min(1.5 * ds, ds_max)
+        return points, tangents
+
+    def locate(
+        self,
+        u_a: np.ndarray,
+        u_b: np.ndarray,
+        t_a: np.ndarray,
+        test: Callable[[np.ndarray, np.ndarray], float],
+        n_iter: int = 30,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Zero of test(u, tangent) between two points of the curve (Illinois method)"""
+        g_a, g_b = test(u_a, t_a), test(u_b, self.tangent(u_b, t_a))
+        a, b = 0.0, 1.0
+        u, t = u_a, t_a
+        normal = (u_b - u_a) / np.linalg.norm(u_b - u_a)
+        side = 0
+        for _ in range(n_iter):
+            theta = (a * g_b - b * g_a) / (g_b - g_a)
+            anchor = u_a + theta * (u_b - u_a)
+            corrected, _ = self.correct(anchor, normal, anchor)
+            if corrected is None:
+                break
+            u, t = corrected, self.tangent(corrected, t_a)
+            g = test(u, t)
+            if abs(b - a) < 1e-10 or g == 0:
+                break
+            if np.sign(g) == np.sign(g_a):
+                a, g_a = theta, g
+                if side == -1:
+                    g_b /= 2
+                side = -1
+            else:
+                b, g_b = theta, g
+                if side == 1:
+                    g_a /= 2
+                side = 1
+        return u, t
+
+
+def _positive(eq: _Equilibria, tol: float) -> Callable[[np.ndarray], bool]:
+    def keep(z: np.ndarray) -> bool:
+        return bool(np.all(eq.r.full(z[: eq.n]) > -tol))
+
+    return keep
+
+
+def _within(
+    bounds: Sequence[Tuple[float, float]], n: int
+) -> Callable[[np.ndarray], bool]:
+    def keep(z: np.ndarray) -> bool:
+        return all(lo <= p <= hi for p, (lo, hi) in zip(z[n:], bounds))
+
+    return keep
+
+
+def continuation(
+    m: Model,
+    y0: Any,
+    parameter: str,
+    bounds: Tuple[float, float],
+    direction: int = 1,
+    ds: float = 0.02,
+    ds_min: float = 1e-6,
+    ds_max: float = 0.2,
+    max_steps: int = 500,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Branch of steady states along parameter, with its saddle-node and Hopf points.
+
+    Starts from the steady state closest to y0 at the current value of parameter in
+    m and follows the branch by pseudo-arclength continuation (so it passes folds,
+    where a plain scan like pfd_ss_scan fails) in the given direction until the
+    parameter leaves bounds or a concentration gets negative. Steps are relative:
+    every compound and the parameter are scaled by their start values.
+
+    Returns the branch (one row per point: parameter, compounds, largest real part
+    of the eigenvalues, number of unstable eigenvalues, stable) and the
+    bifurcations (type "fold", "hopf" or "branch point", located to solver precision,
+    with the parameter value and the state).
+
+        branch, points = continuation(m, y_ss, "pfd", (10, 3000))
+    """
+    eq = _Equilibria(m, y0, [parameter])
+    n = eq.n
+    p0 = np.array([m.get_parameter(parameter)], dtype=float)
+    x0 = eq.r.steady_state(tol=1e-12)
+    if x0 is None:
+        raise ValueError("No steady state close to y0")
+    z0 = np.append(eq.r.reduce(x0), p0)
+
+    def F(z: np.ndarray) -> np.ndarray:
+        return eq.f(z[:n], z[n:])
+
+    def jac(z: np.ndarray) -> np.ndarray:
+        return np.hstack([eq.jac_x(z[:n], z[n:]), eq.jac_p(z[:n], z[n:])])
+
+    scale = np.maximum(np.abs(z0), 1e-2)
+    curve = _Curve(F, jac, scale)
+    u0 = z0 / scale
+    # start tangent: null vector of the Jacobian, pointing towards direction
+    t0 = np.linalg.svd(curve.J(u0))[2][-1]
+    t0 *= np.sign(t0[n]) * np.sign(direction) or 1
+    keep_positive = _positive(eq, 1e-9)
+    keep_bounds = _within([bounds], n)
+    points, tangents = curve.run(
+        u0,
+        t0,
+        ds,
+        ds_min,
+        ds_max,
+        max_steps,
+        lambda z: keep_positive(z) and keep_bounds(z),
+    )
+
+    rows, bifurcations = [], []
+    previous: Optional[Dict[str, Any]] = None
+    for u, t in zip(points, tangents):
+        z = u * scale
+        J = eq.jac_x(z[:n], z[n:])
+        max_real, n_unstable, n_complex = _stability(J)
+        row = {
+            parameter: z[n],
+            **dict(zip(eq.r.compounds, eq.r.full(z[:n]))),
+            "max_real": max_real,
+            "n_unstable": n_unstable,
+            "stable": n_unstable == 0,
+        }
+        current = {
+            "u": u,
+            "t": t,
+            "det": np.linalg.slogdet(J)[0],
+            "n_complex": n_complex,
+        }
+        if previous is not None:
+            bifurcations.extend(_detect(eq, curve, previous, current, parameter))
+        rows.append(row)
+        previous = current
+    branch = pd.DataFrame(rows)
+    columns = ["type", parameter, *eq.r.compounds]
+    return branch, pd.DataFrame(bifurcations, columns=columns)
+
+
+def _detect(
+    eq: _Equilibria,
+    curve: _Curve,
+    a: Dict[str, Any],
+    b: Dict[str, Any],
+    parameter: str,
+) -> List[Dict[str, Any]]:
+    n = eq.n
+    found = []
+
+    def point(kind: str, u: np.ndarray) -> Dict[str, Any]:
+        z = u * curve.scale
+        return {
+            "type": kind,
+            parameter: z[n],
+            **dict(zip(eq.r.compounds, eq.r.full(z[:n]))),
+        }
+
+    if np.sign(a["t"][n]) != np.sign(b["t"][n]):
+        u, _ = curve.locate(a["u"], b["u"], a["t"], lambda u, t: t[n])
+        found.append(point("fold", u))
+    elif a["det"] != b["det"]:
+        # determinant changes sign without the parameter turning around
+        found.append(point("branch point", b["u"]))
+    if a["n_complex"] != b["n_complex"]:
+
+        def test(u: np.ndarray, t: np.ndarray) -> float:
+            z = u * curve.scale
+            return _hopf_test(eq.jac_x(z[:n], z[n:]))
+
+        u, _ = curve.locate(a["u"], b["u"], a["t"], test)
+        found.append(point("hopf", u))
+    return found
+
+
+def bifurcation_curve(
+    m: Model,
+    point: Any,
+    parameters: Tuple[str, str],
+    bounds: Sequence[Tuple[float, float]],
+    direction: int = 1,
+    ds: float = 0.02,
+    ds_min: float = 1e-6,
+    ds_max: float = 0.2,
+    max_steps: int = 200,
+) -> pd.DataFrame:
+    """
+    Curve of a fold or Hopf point in the plane of two parameters.
+
+    point is a row of the bifurcations found by continuation (the first parameter is
+    the one it was found for, the second one is taken from m). The curve is traced
+    by continuation of the steady state together with a test function that is zero
+    on the bifurcation: the bordered-matrix determinant for folds, the real part of
+    the critical complex pair for Hopf points. bounds are the (min, max) of both
+    parameters. Returns one row per point with both parameters and the state.
+
+        branch, points = continuation(m, y_ss, "pfd", (10, 3000))
+        fold = points[points["type"] == "fold"].iloc[0]
+        curve = bifurcation_curve(m, fold, ("pfd", "kcyc"), [(10, 3000), (0, 10)])
+    """
+    kind = point["type"]
+    if kind not in ("fold", "hopf"):
+        raise ValueError(f"No curves for bifurcations of type {kind!r}")
+    m = m.copy()
+    m.update_parameter(parameters[0], float(point[parameters[0]]))
+    y = {c: point[c] for c in m.get_compounds()}
+    eq = _Equilibria(m, y, parameters)
+    n = eq.n
+    p0 = np.array([m.get_parameter(p) for p in parameters], dtype=float)
+    z0 = np.append(eq.r.reduce(y), p0)
+
+    if kind == "fold":
+        U, _, Vt = np.linalg.svd(eq.jac_x(z0[:n], z0[n:]))
+        b, c = U[:, -1], Vt[-1]
+
+        def test(z: np.ndarray) -> float:
+            return _fold_test(eq.jac_x(z[:n], z[n:]), b, c)
+
+    else:
+
+        def test(z: np.ndarray) -> float:
+            return _hopf_test(eq.jac_x(z[:n], z[n:]))
+
+    def F(z: np.ndarray) -> np.ndarray:
+        return np.append(eq.f(z[:n], z[n:]), test(z))
+
+    def jac(z: np.ndarray) -> np.ndarray:
+        top = np.hstack([eq.jac_x(z[:n], z[n:]), eq.jac_p(z[:n], z[n:])])
+        h = _steps(z)
+        row = np.empty(len(z))
+        for i in range(len(z)):
+            dz = np.zeros_like(z)
+            dz[i] = h[i]
+            row[i] = (test(z + dz) - test(z - dz)) / (2 * h[i])
+        return np.vstack([top, row])
+
+    scale = np.maximum(np.abs(z0), 1e-2)
+    curve = _Curve(F, jac, scale)
+    # the point was located along the first parameter, refine it at fixed second one
+    normal = np.zeros(len(z0))
+    normal[-1] = 1
+    u0, _ = curve.correct(z0 / scale, normal, z0 / scale)
+    if u0 is None:
+        raise ValueError(f"Could not converge to the {kind} point")
+    t0 = np.linalg.svd(curve.J(u0))[2][-1]
+    t0 *= np.sign(t0[-1]) * np.sign(direction) or 1
+    keep_positive = _positive(eq, 1e-9)
+    keep_bounds = _within(bounds, n)
+    points, _ = curve.run(
+        u0,
+        t0,
+        ds,
+        ds_min,
+        ds_max,
+        max_steps,
+        lambda z: keep_positive(z) and keep_bounds(z),
+    )
+    Z = np.array(points) * scale
+    return pd.DataFrame(
+        np.column_stack([Z[:, n:], eq.r.full(Z[:, :n])]),
+        columns=[*parameters, *eq.r.compounds],
+    )
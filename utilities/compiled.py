@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+__all__ = ["numba_available", "compile_model"]
+
+import functools
+import importlib.util
+import logging
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from modelbase.ode import Model
+
+logger = logging.getLogger(__name__)
+
+
+def numba_available() -> bool:
+    return importlib.util.find_spec("numba") is not None
+
+
+def _signature(args: Tuple[Any, ...]) -> Tuple[Any, ...]:
+    # what numba dispatches on: scalars by type, arrays by dtype and dimensions
+    return tuple(
+        (type(a), getattr(a, "dtype", None), getattr(a, "ndim", None)) for a in args
+    )
+
+
+def _jit(function: Callable, fallbacks: List[str]) -> Callable:
+    """
+    Compiled version of function for every argument types it sees.
+
+    Argument types numba cannot type the function for (python branching on
+    isinstance, calls of other plain python functions, ...) fall back to the
+    original on their first call and stay there; other argument types, e.g. scalars
+    next to failing arrays, keep their compiled version.
+    """
+    import numba
+    from numba.core.errors import NumbaError
+
+    compiled = numba.njit(cache=True, nogil=True)(function)
+    python: Set[Tuple[Any, ...]] = set()
+
+    @functools.wraps(function)
+    def wrapper(*args: Any) -> Any:
+        signature = _signature(args)
+        if signature in python:
+            return function(*args)
+        try:
+            return compiled(*args)
+        except NumbaError:
+            python.add(signature)
+            if function.__name__ not in fallbacks:
+                fallbacks.append(function.__name__)
+            logger.info(
+                "%s could not be compiled for %s, using python",
+                function.__name__,
+                [t.__name__ for t, _, _ in signature],
+            )
+            return function(*args)
+
+    wrapper.py_func = function  # type: ignore[attr-defined]
+    return wrapper
+
+
+def _model_functions(model: Model, prefix: str) -> List[Tuple[Any, str]]:
+    owners: List[Tuple[Any, str]] = []
+    for rate in model.rates.values():
+        owners.append((rate, "function"))
+    for module in model.algebraic_modules.values():
+        owners.append((module, "function"))
+    for parameter in model.derived_parameters.values():
+        owners.append((parameter, "function"))
+    return [
+        (owner, attribute)
+        for owner, attribute in owners
+        if getattr(_get(owner, attribute), "__module__", "").startswith(prefix)
+        and not hasattr(_get(owner, attribute), "py_func")
+    ]
+
+
+def _get(owner: Any, attribute: str) -> Callable:
+    return owner[attribute] if isinstance(owner, dict) else getattr(owner, attribute)
+
+
+def _set(owner: Any, attribute: str, function: Callable) -> None:
+    if isinstance(owner, dict):
+        owner[attribute] = function
+    else:
+        setattr(owner, attribute, function)
+
+
+def compile_model(model: Model, prefix: str = "models.") -> Model:
+    """
+    JIT-compile the rate laws, algebraic modules and derived parameters of a model.
+
+    Only functions defined in the model packages (module name starting with prefix,
+    i.e. rate_laws.py, matuszynska.py, mehler.py, ...) are compiled, for scalar and
+    array arguments alike. The kernels release the GIL, so compiled models gain from
+    running simulations in threads (utilities.parallel). Without numba installed the
+    model is returned unchanged, so the call can always be made. Works in place and
+    returns the model.
+
+        m = compile_model(get_model())
+        m.compiled_fallbacks  # functions that stayed python for some argument types
+    """
+    if not numba_available():
+        logger.info("numba not installed, model is not compiled")
+        return model
+    fallbacks: List[str] = []
+    compiled: Dict[Callable, Callable] = {}
+    for owner, attribute in _model_functions(model, prefix):
+        function = _get(owner, attribute)
+        # shared rate laws (mass_action_1s, ...) are compiled once
+        if function not in compiled:
+            compiled[function] = _jit(function, fallbacks)
+        _set(owner, attribute, compiled[function])
+    model.compiled_fallbacks = fallbacks  # type: ignore[attr-defined]
+    return model
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+__all__ = [
+    "conservation_laws",
+    "conserved_totals",
+    "describe_conservation_laws",
+    "conservation_drift",
+    "ReducedSystem",
+]
+
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+from scipy import integrate, linalg, optimize
+
+from .linearization import model_jacobian, stoichiometric_matrix
+
+
+def _rref(A: np.ndarray, tol: float) -> Tuple[np.ndarray, list]:
+    A = A.copy()
+    pivots = []
+    row = 0
+    for col in range(A.shape[1]):
+        if row == A.shape[0]:
+            break
+        best = row + np.argmax(np.abs(A[row:, col]))
+        if abs(A[best, col]) < tol:
+            continue
+        A[[row, best]] = A[[best, row]]
+        A[row] /= A[row, col]
+        others = np.arange(A.shape[0]) != row
+        A[others] -= np.outer(A[others, col], A[row])
+        pivots.append(col)
+        row += 1
+    A[np.abs(A) < tol] = 0.0
+    return A[:row], pivots
+
+
+def conservation_laws(m: Model, tol: float = 1e-9) -> pd.DataFrame:
+    """
+    Left null space of the stoichiometric matrix (laws as rows, compounds as columns).
+
+    The basis is in reduced row echelon form, so every law has one compound with
+    coefficient 1 that appears in no other law. This is the dependent compound the
+    law can be solved for. Compounds that no reaction changes show up as laws of
+    their own.
+    """
+    compounds = m.get_compounds()
+    N = stoichiometric_matrix(m)
+    L = linalg.null_space(N.T, rcond=tol).T
+    if len(L) == 0:
+        return pd.DataFrame(np.zeros((0, len(compounds))), columns=compounds)
+    L, pivots = _rref(L, tol)
+    return pd.DataFrame(
+        L, index=[compounds[p] for p in pivots], columns=compounds
+    ).rename_axis("dependent")
+
+
+def conserved_totals(m: Model, y: Any, laws: Optional[pd.DataFrame] = None) -> pd.Series:
+    """Value of every conservation law at the state y (dict or array in compound order)"""
+    if laws is None:
+        laws = conservation_laws(m)
+    if isinstance(y, dict):
+        y = [y[c] for c in m.get_compounds()]
+    return pd.Series(
+        laws.to_numpy() @ np.asarray(y, dtype=float), index=laws.index, name="total"
+    )
+
+
+def _expression(law: pd.Series) -> str:
+    terms = []
+    for compound, n in law[law != 0].items():
+        sign = "-" if n < 0 else "+"
+        factor = "" if np.isclose(abs(n), 1) else f"{abs(n):g} "
+        terms.append(f"{sign} {factor}{compound}")
+    return " ".join(terms).lstrip("+ ")
+
+
+def describe_conservation_laws(m: Model, y: Optional[Any] = None) -> pd.DataFrame:
+    """
+    Readable list of the conserved totals of a model.
+
+    Moieties that are already hand-coded as algebraic modules (moiety_1, Pimoiety, ...)
+    have removed a compound from the state and do not show up here, so for the full
+    models an empty frame means nothing has been forgotten.
+    """
+    laws = conservation_laws(m)
+    described = pd.DataFrame(
+        {
+            "expression": [_expression(law) for _, law in laws.iterrows()],
+            "n_compounds": (laws != 0).sum(axis=1),
+        },
+        index=laws.index,
+    )
+    if y is not None:
+        described["total"] = conserved_totals(m, y, laws)
+    return described
+
+
+def conservation_drift(
+    results: pd.DataFrame,
+    quantity: Union[str, Dict[str, float]],
+) -> pd.DataFrame:
+    """
+    Drift of a quantity that should be conserved, per time point of a simulation.
+
+    quantity is a column of results (e.g. "electrons" of the PSI-only models) or a
+    linear combination of columns, {"PCred": 1, "Fdred": 1, ...}. The drift is taken
+    relative to the first time point; the largest absolute drift is in
+    .attrs["max_abs_drift"].
+
+        drift = conservation_drift(s.get_full_results_df(), "electrons")
+    """
+    if isinstance(quantity, str):
+        values = results[quantity].to_numpy(dtype=float)
+    else:
+        columns = list(quantity)
+        values = results[columns].to_numpy(dtype=float) @ np.array(
+            [quantity[c] for c in columns]
+        )
+    drift = values - values[0]
+    scale = abs(values[0]) if values[0] != 0 else 1.0
+    monitor = pd.DataFrame(
+        {"value": values, "drift": drift, "rel_drift": drift / scale},
+        index=results.index,
+    )
+    monitor.attrs["max_abs_drift"] = float(np.max(np.abs(drift), initial=0.0))
+    return monitor
+
+
+class ReducedSystem:
+    """
+    The model with every conservation law used to eliminate its dependent compound.
+
+    The totals are taken from y0. The reduced state x are the independent compounds;
+    rhs and jacobian of the reduced system are regular, so steady states can be found
+    with a Newton type root finder, which fails on the singular full Jacobian.
+
+        r = ReducedSystem(m, y0)
+        y_ss = r.steady_state()
+        t, Y = r.integrate(100)
+    """
+
+    def __init__(self, model: Model, y0: Any, tol: float = 1e-9) -> None:
+        self.model = model
+        self.compounds = model.get_compounds()
+        if isinstance(y0, dict):
+            y0 = [y0[c] for c in self.compounds]
+        self.y0 = np.asarray(y0, dtype=float)
+        self.laws = conservation_laws(model, tol=tol)
+        self.dependent = np.array(
+            [self.compounds.index(c) for c in self.laws.index], dtype=int
+        )
+        self.independent = np.array(
+            [i for i in range(len(self.compounds)) if i not in set(self.dependent)],
+            dtype=int,
+        )
+        L = self.laws.to_numpy()
+        self.totals = L @ self.y0
+        # y[dependent] = totals - L_ind @ x, as L[:, dependent] is the identity
+        self._L_ind = L[:, self.independent]
+
+    @property
+    def independent_compounds(self) -> list:
+        return [self.compounds[i] for i in self.independent]
+
+    def reduce(self, y: Any) -> np.ndarray:
+        if isinstance(y, dict):
+            y = [y[c] for c in self.compounds]
+        return np.asarray(y, dtype=float)[..., self.independent]
+
+    def full(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=float)
+        y = np.empty(x.shape[:-1] + (len(self.compounds),))
+        y[..., self.independent] = x
+        y[..., self.dependent] = self.totals - x @ self._L_ind.T
+        return y
+
+    def rhs(self, t: float, x: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model._get_rhs(t, self.full(x)))[self.independent]
+
+    def jacobian(self, t: float, x: np.ndarray) -> np.ndarray:
+        J = model_jacobian(self.model, self.full(x), t)
+        J_ii = J[np.ix_(self.independent, self.independent)]
+        J_id = J[np.ix_(self.independent, self.dependent)]
+        return J_ii - J_id @ self._L_ind
+
+    def integrate(
+        self,
+        t_end: float,
+        t_eval: Optional[np.ndarray] = None,
+        method: str = "BDF",
+        **kwargs: Any,
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """Integrate the reduced system from y0, returns time and full states (rows)"""
+        kwargs = {"atol": 1e-8, "rtol": 1e-8, **kwargs}
+        if method in ("BDF", "Radau", "LSODA"):
+            kwargs.setdefault("jac", self.jacobian)
+        sol = integrate.solve_ivp(
+            self.rhs,
+            (0, t_end),
+            self.reduce(self.y0),
+            method=method,
+            t_eval=t_eval,
+            **kwargs,
+        )
+        if not sol.success:
+            return None, None
+        return sol.t, self.full(sol.y.T)
+
+    def steady_state(
+        self,
+        x0: Optional[Any] = None,
+        tol: float = 1e-10,
+        method: str = "hybr",
+    ) -> Optional[Dict[str, float]]:
+        """Root of the reduced rhs from x0 (default y0) as a full state dict, or None"""
+        x0 = self.reduce(self.y0 if x0 is None else x0)
+        sol = optimize.root(
+            lambda x: self.rhs(0, x),
+            x0,
+            jac=lambda x: self.jacobian(0, x),
+            method=method,
+            tol=tol,
+        )
+        if not sol.success or not np.all(np.isfinite(sol.x)):
+            return None
+        return dict(zip(self.compounds, self.full(sol.x)))
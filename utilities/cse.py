@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+__all__ = [
+    "trace_function",
+    "optimize_function",
+    "verify_function",
+    "optimize_algebraic_modules",
+]
+
+import inspect
+import math
+import time
+import types
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+
+
+class _SympyNumpy(types.SimpleNamespace):
+    """Stand-in for numpy while a function is traced with sympy symbols"""
+
+
+def _sympy_numpy() -> _SympyNumpy:
+    import sympy
+
+    return _SympyNumpy(
+        exp=sympy.exp,
+        log=sympy.log,
+        log10=lambda x: sympy.log(x, 10),
+        sqrt=sympy.sqrt,
+        power=sympy.Pow,
+        abs=sympy.Abs,
+        pi=sympy.pi,
+        e=sympy.E,
+    )
+
+
+def trace_function(function: Callable) -> Tuple[List[Any], Any, type]:
+    """
+    Evaluate function with one sympy symbol per argument.
+
+    np.exp, np.log, ... inside the function are replaced by their sympy versions.
+    Returns the symbols, the output expressions (a list) and the type of the output
+    (tuple, list, np.ndarray or a single expression).
+    """
+    import sympy
+
+    names = list(inspect.signature(function).parameters)
+    symbols = [sympy.Symbol(n) for n in names]
+    shim = _sympy_numpy()
+    namespace = dict(function.__globals__)
+    for name, value in function.__globals__.items():
+        if value is np:
+            namespace[name] = shim
+        elif value is math:
+            namespace[name] = shim
+    traced = types.FunctionType(
+        function.__code__,
+        namespace,
+        function.__name__,
+        function.__defaults__,
+        function.__closure__,
+    )
+    output = traced(*symbols)
+    if isinstance(output, (tuple, list, np.ndarray)):
+        return symbols, [sympy.sympify(o) for o in output], type(output)
+    return symbols, [sympy.sympify(output)], sympy.Expr
+
+
+def optimize_function(function: Callable) -> Callable:
+    """
+    Equivalent of function with common subexpressions computed once.
+
+    Works for functions that are closed-form expressions of their arguments (the
+    analytic QSSA modules, rate laws); the generated function takes the same
+    arguments and returns the same kind of output, for scalars and arrays alike.
+    """
+    import sympy
+
+    symbols, outputs, kind = trace_function(function)
+    generated = sympy.lambdify(symbols, outputs, modules="numpy", cse=True)
+
+    if kind is sympy.Expr:
+
+        def optimized(*args: Any) -> Any:
+            return generated(*args)[0]
+
+    elif kind is np.ndarray:
+
+        def optimized(*args: Any) -> Any:
+            return np.array(np.broadcast_arrays(*generated(*args)))
+
+    else:
+
+        def optimized(*args: Any) -> Any:
+            return kind(generated(*args))
+
+    optimized.__name__ = function.__name__
+    optimized.__doc__ = function.__doc__
+    optimized.__signature__ = inspect.signature(function)  # type: ignore[attr-defined]
+    optimized.original = function  # type: ignore[attr-defined]
+    optimized.operations = (  # type: ignore[attr-defined]
+        sum(sympy.count_ops(o) for o in outputs),
+        _count_cse_ops(outputs),
+    )
+    return optimized
+
+
+def _count_cse_ops(outputs: List[Any]) -> int:
+    import sympy
+
+    replacements, reduced = sympy.cse(outputs)
+    return sum(sympy.count_ops(e) for _, e in replacements) + sum(
+        sympy.count_ops(e) for e in reduced
+    )
+
+
+def _sample(
+    reference: Sequence[float], n: int, spread: float, seed: int
+) -> List[np.ndarray]:
+    # log-normal perturbations keep the sign of every argument (concentrations,
+    # rate constants, equilibrium constants are positive)
+    rng = np.random.default_rng(seed)
+    return [
+        np.asarray(r, dtype=float) * np.exp(spread * rng.standard_normal(n))
+        for r in reference
+    ]
+
+
+def _as_array(output: Any) -> np.ndarray:
+    if isinstance(output, (tuple, list)):
+        return np.array(np.broadcast_arrays(*output), dtype=float)
+    return np.asarray(output, dtype=float)
+
+
+def verify_function(
+    original: Callable,
+    optimized: Callable,
+    reference: Sequence[float],
+    n: int = 1000,
+    spread: float = 1.0,
+    rtol: float = 1e-9,
+    seed: int = 0,
+) -> float:
+    """
+    Largest relative difference of the two functions around reference arguments.
+
+    Raises ValueError if it exceeds rtol.
+    """
+    args = _sample(reference, n, spread, seed)
+    expected = _as_array(original(*args))
+    actual = _as_array(optimized(*args))
+    scale = np.maximum(np.abs(expected), np.finfo(float).tiny)
+    finite = np.isfinite(expected)
+    if not np.array_equal(finite, np.isfinite(actual)):
+        raise ValueError(f"{original.__name__}: non-finite values differ")
+    error = float(np.max(np.abs(actual - expected)[finite] / scale[finite], initial=0.0))
+    if error > rtol:
+        raise ValueError(
+            f"{original.__name__}: relative difference {error:.2e} > {rtol:.0e}"
+        )
+    return error
+
+
+def _time_per_call(function: Callable, args: Sequence[Any], repeat: int = 2000) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function(*args)
+    return (time.perf_counter() - start) / repeat
+
+
+def optimize_algebraic_modules(
+    m: Model,
+    y: Dict[str, float],
+    modules: Optional[Sequence[str]] = None,
+    rtol: float = 1e-9,
+    min_saving: int = 1,
+) -> pd.DataFrame:
+    """
+    Replace algebraic module functions of m by their CSE versions, in place.
+
+    Every candidate is verified against the original around its arguments at the
+    state y; modules that cannot be traced, fail the verification, save fewer than
+    min_saving operations or get slower per call (the lambdified function has some
+    overhead, which the one-line moieties do not make up for) are left alone.
+    Returns a report per module.
+    """
+    import sympy
+
+    values = {**m.get_full_concentration_dict(y, 0), **m.get_parameters()}
+    values = {k: float(np.asarray(v).ravel()[0]) for k, v in values.items()}
+    rows = []
+    for name in m.algebraic_modules if modules is None else modules:
+        module = m.algebraic_modules[name]
+        original = getattr(module.function, "original", module.function)
+        row: Dict[str, Any] = {"module": name, "function": original.__name__}
+        try:
+            optimized = optimize_function(original)
+            reference = [values[a] for a in module.args]
+            row["ops_before"], row["ops_after"] = optimized.operations
+            row["max_rel_error"] = verify_function(
+                original, optimized, reference, rtol=rtol
+            )
+            row["us_before"] = 1e6 * _time_per_call(original, reference)
+            row["us_after"] = 1e6 * _time_per_call(optimized, reference)
+        except (ValueError, TypeError, AttributeError, KeyError, sympy.SympifyError) as e:
+            row["status"] = f"skipped: {e!r}"[:120]
+            rows.append(row)
+            continue
+        if (
+            row["ops_before"] - row["ops_after"] < min_saving
+            or row["us_after"] > 1.1 * row["us_before"]
+        ):
+            row["status"] = "no saving"
+        else:
+            module.function = optimized
+            row["status"] = "optimized"
+        rows.append(row)
+    return pd.DataFrame(rows).set_index("module")
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+__all__ = ["Event", "Threshold", "Extremum", "pulse_peaks", "npq_from_events"]
+
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+
+from .linearization import batched_rhs
+
+
+class Event:
+    """
+    A zero crossing of g(t, y) to be located while a simulation runs.
+
+    The integrator checks the sign of g after every accepted step and finds the
+    exact crossing time on the solver's dense output (utilities.integrator), so
+    events are exact without storing the trajectory. Every occurrence is recorded
+    with the values of the record variables (compounds, derived compounds) there.
+
+    direction: 1 only rising, -1 only falling, 0 both. when: parameter values the
+    event is restricted to, e.g. {"pfd": 5000} for saturating pulses only.
+    """
+
+    direction = 0
+
+    def __init__(
+        self,
+        record: Sequence[str] = (),
+        when: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.record = list(record)
+        self.when = {} if when is None else dict(when)
+        self.reset()
+
+    def reset(self) -> None:
+        self.occurrences: List[Dict[str, Any]] = []
+
+    def active(self, parameters: Dict[str, float]) -> bool:
+        return all(parameters.get(k) == v for k, v in self.when.items())
+
+    def g(self, values: Dict[str, Any], derivative: Callable[[str], np.ndarray]) -> Any:
+        raise NotImplementedError
+
+    def _kind(self, sign: int) -> str:
+        return "rising" if sign > 0 else "falling"
+
+    def found(
+        self, t: float, values: Dict[str, Any], sign: int, where: str = "inside"
+    ) -> None:
+        self.occurrences.append(
+            {
+                "time": t,
+                "kind": self._kind(sign),
+                "where": where,
+                **{v: float(np.asarray(values[v]).ravel()[0]) for v in self.record},
+            }
+        )
+
+    def finish(self, first: Dict[str, Any], last: Dict[str, Any]) -> None:
+        """Called with the first and last point (t, values, g) of every segment"""
+
+    def get_result(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            self.occurrences, columns=["time", "kind", "where", *self.record]
+        )
+
+
+class Threshold(Event):
+    """variable crossing level, e.g. Threshold("rel_P700+", 0.5, direction=1)"""
+
+    def __init__(
+        self,
+        variable: str,
+        level: float,
+        direction: int = 0,
+        record: Optional[Sequence[str]] = None,
+        when: Optional[Dict[str, float]] = None,
+    ) -> None:
+        self.variable = variable
+        self.level = level
+        self.direction = direction
+        super().__init__(record=[variable] if record is None else record, when=when)
+
+    def g(self, values: Dict[str, Any], derivative: Callable[[str], np.ndarray]) -> Any:
+        return np.asarray(values[self.variable], dtype=float) - self.level
+
+
+class Extremum(Event):
+    """
+    Local maxima ("max"), minima ("min") or both of variable: zero crossings of its
+    time derivative.
+
+    With include_ends the first or last point of a segment counts too if the
+    variable moves away from it (e.g. Fluo still rising when a pulse ends), so the
+    largest maximum of a segment is its maximum.
+    """
+
+    def __init__(
+        self,
+        variable: str,
+        kind: str = "max",
+        include_ends: bool = True,
+        record: Optional[Sequence[str]] = None,
+        when: Optional[Dict[str, float]] = None,
+    ) -> None:
+        if kind not in ("max", "min", "both"):
+            raise ValueError(f"kind has to be max, min or both, not {kind}")
+        self.variable = variable
+        self.kind = kind
+        self.include_ends = include_ends
+        # a maximum is where the derivative falls through 0
+        self.direction = {"max": -1, "min": 1, "both": 0}[kind]
+        super().__init__(record=[variable] if record is None else record, when=when)
+
+    def g(self, values: Dict[str, Any], derivative: Callable[[str], np.ndarray]) -> Any:
+        return derivative(self.variable)
+
+    def _kind(self, sign: int) -> str:
+        return "min" if sign > 0 else "max"
+
+    def finish(self, first: Dict[str, Any], last: Dict[str, Any]) -> None:
+        if not self.include_ends:
+            return
+        # a start the variable falls from is a maximum, an end it rises to as well
+        for point, where, sign in ((first, "start", 1), (last, "end", -1)):
+            g = point["g"]
+            for kind_sign in (-1, 1):
+                if self.direction in (0, kind_sign) and g * sign * kind_sign > 0:
+                    self.found(point["t"], point["values"], kind_sign, where)
+
+
+class _EventSet:
+    """
+    The active events of a simulator for one simulate call, in the form the
+    StepIntegrator works with: g of all events for rows of states (no side
+    effects, the integrator also calls it while locating crossings), their
+    directions, and found to record an occurrence.
+    """
+
+    def __init__(self, model: Model, events: Sequence[Event]) -> None:
+        self.model = model
+        self.events = list(events)
+        self.directions = np.array([e.direction for e in self.events])
+        self.compounds = model.get_compounds()
+
+    def _values(self, t: np.ndarray, Y: np.ndarray) -> Dict[str, Any]:
+        return self.model.get_full_concentration_dict(Y, t)
+
+    def __call__(self, t: np.ndarray, Y: np.ndarray) -> np.ndarray:
+        t = np.asarray(t, dtype=float)
+        Y = np.atleast_2d(Y)
+        values = self._values(t, Y)
+        cache: Dict[str, np.ndarray] = {}
+        rhs: List[np.ndarray] = []
+
+        def derivative(name: str) -> np.ndarray:
+            if name not in cache:
+                if not rhs:
+                    rhs.append(batched_rhs(self.model, Y, t))
+                F = rhs[0]
+                if name in self.compounds:
+                    cache[name] = F[:, self.compounds.index(name)]
+                else:
+                    # along the trajectory: (x(y + h f) - x(y - h f)) / 2h, with
+                    # the largest relative change of a compound 1e-6
+                    rate = np.max(np.abs(F) / (np.abs(Y) + 1e-8), axis=1)
+                    h = np.where(rate > 0, 1e-6 / np.where(rate > 0, rate, 1), 0)
+                    shifted = self._values(
+                        np.r_[t, t], np.vstack([Y + h[:, None] * F, Y - h[:, None] * F])
+                    )
+                    x = np.broadcast_to(
+                        np.asarray(shifted[name], dtype=float), (2 * len(Y),)
+                    )
+                    safe = np.where(h > 0, h, 1)
+                    cache[name] = np.where(
+                        h > 0, (x[: len(Y)] - x[len(Y) :]) / (2 * safe), 0
+                    )
+            return cache[name]
+
+        return np.column_stack(
+            [
+                np.broadcast_to(
+                    np.asarray(e.g(values, derivative), dtype=float), (len(Y),)
+                )
+                for e in self.events
+            ]
+        )
+
+    def found(self, i: int, t: float, y: np.ndarray, sign: int) -> None:
+        self.events[i].found(t, self._values(np.array([t]), y[None, :]), sign)
+
+    def finish(self, time: np.ndarray, results: np.ndarray) -> None:
+        """Boundary occurrences of a finished segment (its returned time and results)"""
+        t = np.array([time[0], time[-1]], dtype=float)
+        Y = np.array([results[0], results[-1]], dtype=float)
+        G = self(t, Y)
+        points = [
+            {"t": t[k], "values": self._values(t[k : k + 1], Y[k : k + 1]), "g": G[k]}
+            for k in range(2)
+        ]
+        for i, event in enumerate(self.events):
+            first, last = ({**p, "g": p["g"][i]} for p in points)
+            event.finish(first, last)
+
+
+def pulse_peaks(
+    s: Any,
+    name: str = "Fm",
+    parameter: str = "pfd",
+    value: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Largest maximum of the Extremum event name in every segment with parameter at
+    value (default: its largest value, i.e. the saturating pulses).
+
+    One row per pulse with its start, end and the time and value of the peak.
+    """
+    event = s.events[name]
+    occurrences = event.get_result()
+    occurrences = occurrences[occurrences["kind"] == "max"]
+    segments = s.get_segments(parameters=[parameter])
+    if value is None:
+        value = segments[parameter].max()
+    rows = []
+    for start, end in segments.loc[segments[parameter] == value, ["start", "end"]].values:
+        inside = occurrences[occurrences["time"].between(start, end)]
+        if len(inside) == 0:
+            continue
+        peak = inside.loc[inside[event.variable].idxmax()]
+        rows.append(
+            {"start": start, "end": end, "time": peak["time"], name: peak[event.variable]}
+        )
+    return pd.DataFrame(rows, columns=["start", "end", "time", name])
+
+
+def npq_from_events(s: Any, name: str = "Fm", parameter: str = "pfd") -> pd.DataFrame:
+    """
+    Fm, Fm' and NPQ = (Fm - Fm') / Fm' of a PAM simulation from the pulse peaks of
+    an Extremum event on Fluo (the first pulse gives Fm).
+
+        s.add_event("Fm", Extremum("Fluo", when={"pfd": 5000}))
+        pam_analysis(s, integrator_kwargs={"store": False})
+        npq = npq_from_events(s)
+    """
+    peaks = pulse_peaks(s, name=name, parameter=parameter)
+    Fm = peaks[name].to_numpy()
+    peaks["NPQ"] = (Fm[0] - Fm) / Fm
+    return peaks
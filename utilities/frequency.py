@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+__all__ = ["OUTPUTS", "linearize", "transfer_function", "frequency_response"]
+
+import logging
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+
+from .linearization import _steps, batched_rhs, model_jacobian
+from .parameters import update_parameters
+
+logger = logging.getLogger(__name__)
+
+# measured signals of the light experiments
+OUTPUTS = ["Fluo", "rel_P700+", "pH", "ATP_norm"]
+
+
+def _outputs(m: Model, Y: np.ndarray, t: float, outputs: Sequence[str]) -> np.ndarray:
+    Y = np.atleast_2d(Y)
+    values = m.get_full_concentration_dict(Y, np.full(len(Y), t))
+    return np.column_stack(
+        [np.broadcast_to(np.asarray(values[o], dtype=float), (len(Y),)) for o in outputs]
+    )
+
+
+def linearize(
+    m: Model,
+    y: Any,
+    parameter: str = "pfd",
+    outputs: Sequence[str] = OUTPUTS,
+    t: float = 0.0,
+) -> Dict[str, np.ndarray]:
+    """
+    State space model of small changes of parameter around the steady state y.
+
+        dx/dt = A x + B u,   z = C x + D u
+
+    with x the deviation of the state compounds, u the deviation of parameter and z
+    the deviation of outputs (any compound or derived compound). All derivatives are
+    central differences, the perturbed states of each one evaluated in one batch.
+    """
+    if isinstance(y, dict):
+        y = [y[c] for c in m.get_compounds()]
+    y = np.asarray(y, dtype=float)
+    outputs = list(outputs)
+    A = model_jacobian(m, y, t)
+    h = _steps(y)
+    Z = _outputs(m, np.concatenate([y + np.diag(h), y - np.diag(h)]), t, outputs)
+    n = len(y)
+    C = ((Z[:n] - Z[n:]) / (2 * h)[:, None]).T
+
+    # the parameter is changed on a copy, with its derived parameters
+    value = m.get_parameter(parameter)
+    dp = float(_steps(np.array([value]))[0])
+    perturbed = m.copy()
+    f, z = [], []
+    for p in (value + dp, value - dp):
+        update_parameters(perturbed, {parameter: p})
+        f.append(batched_rhs(perturbed, y, t)[0])
+        z.append(_outputs(perturbed, y, t, outputs)[0])
+    B = (f[0] - f[1]) / (2 * dp)
+    D = (z[0] - z[1]) / (2 * dp)
+
+    drift = np.max(np.abs(batched_rhs(m, y, t)[0]))
+    if drift > 1e-4:
+        logger.warning("y is no steady state (max |dy/dt| = %.2g)", drift)
+    return {"A": A, "B": B, "C": C, "D": D, "outputs": np.array(outputs)}
+
+
+def transfer_function(
+    A: np.ndarray,
+    B: np.ndarray,
+    C: np.ndarray,
+    D: np.ndarray,
+    omega: np.ndarray,
+) -> np.ndarray:
+    """
+    G(i omega) = C (i omega - A)^-1 B + D for all angular frequencies at once.
+
+    One batched linear solve, shape (frequencies, outputs). Conserved moieties make
+    A singular, which only matters at omega = 0.
+    """
+    omega = np.asarray(omega, dtype=float)
+    n = len(A)
+    M = 1j * omega[:, None, None] * np.eye(n) - A
+    X = np.linalg.solve(M, np.broadcast_to(B.astype(complex), (len(omega), n))[..., None])
+    return X[..., 0] @ C.T + D
+
+
+def frequency_response(
+    m: Model,
+    y: Any,
+    frequencies: Optional[np.ndarray] = None,
+    parameter: str = "pfd",
+    outputs: Sequence[str] = OUTPUTS,
+) -> pd.DataFrame:
+    """
+    Bode data of the outputs for sinusoidal changes of parameter around steady state y.
+
+    frequencies are in Hz (default 500 between 1e-4 and 1e2). Gain is in output units
+    per parameter unit (e.g. change of Fluo per umol photons m-2 s-1), phase in degrees,
+    unwrapped along the frequencies; columns are (output, "gain" / "phase"). The
+    parameters of m have to be the ones y is the steady state for.
+
+        m.update_parameter("pfd", 300)
+        y_ss = get_stst_y0(Simulator(m), pfd=300)
+        bode = frequency_response(m, y_ss)
+        bode["Fluo"]["gain"].plot(logx=True, logy=True)
+    """
+    if frequencies is None:
+        frequencies = np.logspace(-4, 2, 500)
+    frequencies = np.asarray(frequencies, dtype=float)
+    system = linearize(m, y, parameter=parameter, outputs=outputs)
+    G = transfer_function(
+        system["A"], system["B"], system["C"], system["D"], 2 * np.pi * frequencies
+    )
+    phase = np.degrees(np.unwrap(np.angle(G), axis=0))
+    columns = pd.MultiIndex.from_product([list(outputs), ["gain", "phase"]])
+    data = np.stack([np.abs(G), phase], axis=-1).reshape(len(frequencies), -1)
+    return pd.DataFrame(
+        data, index=pd.Index(frequencies, name="frequency"), columns=columns
+    )
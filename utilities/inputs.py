@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+__all__ = ["add_input", "get_inputs"]
+
+from typing import Any, Callable, Dict, Optional, Sequence, Union
+
+import numpy as np
+from modelbase.ode import Model
+
+INPUT_MODULE_SUFFIX = "_input"
+
+
+def _remove_state(m: Model, name: str) -> None:
+    """Turn a compound that only stood in for an input into nothing"""
+    pseudo = [r for r, s in m.stoichiometries.items() if set(s) <= {name}]
+    m.remove_reactions(pseudo)
+    for r, stoichiometry in list(m.stoichiometries.items()):
+        if name in stoichiometry:
+            raise ValueError(f"{name} is changed by {r}, it cannot be an input")
+    m.remove_compound(name)
+
+
+def _time_function(function: Callable) -> Callable:
+    def input_function(time: Any, *parameters: Any) -> Any:
+        # constant functions still need one value per time point
+        return np.asarray(function(time, *parameters), dtype=float) * np.ones_like(time)
+
+    input_function.__name__ = getattr(function, "__name__", "input_function")
+    return input_function
+
+
+def add_input(
+    m: Model,
+    name: str,
+    value: Union[float, Callable[..., Any]],
+    parameters: Optional[Sequence[str]] = None,
+) -> Model:
+    """
+    Exogenous input that rates and algebraic modules can use without it being a state.
+
+    value is either a number, which makes name a parameter (update_parameter works
+    as usual), or a function of time (and of the given parameters), e.g.
+
+        add_input(m, "ps2cs", 0.525)
+        add_input(m, "ps2cs", lambda t: 0.5 + 0.05 * np.sin(t / 10))
+        add_input(m, "pfd", lambda t, pfd_max: pfd_max * (t % 60 < 30), ["pfd_max"])
+
+    A compound, parameter or input of the same name is replaced; reactions that
+    only kept a compound "constant" (zero stoichiometry pseudo reactions) are removed.
+    Works in place and returns the model.
+    """
+    parameters = [] if parameters is None else list(parameters)
+    if name in m.get_compounds():
+        _remove_state(m, name)
+    module_name = f"{name}{INPUT_MODULE_SUFFIX}"
+    if module_name in m.algebraic_modules:
+        m.remove_algebraic_module(module_name, sort_modules=False)
+
+    if callable(value):
+        if name in m.get_parameter_names():
+            m.remove_parameter(name)
+        # modules using it have to be sorted after the input module
+        for module in m.algebraic_modules.values():
+            if name in module.args and name not in module.compounds:
+                module.compounds.append(name)
+        m.add_algebraic_module(
+            module_name=module_name,
+            function=_time_function(value),
+            derived_compounds=[name],
+            # time is passed as modifier, so the module is sorted before its users
+            modifiers=["time"],
+            parameters=parameters,
+        )
+        # full results are labelled in insertion order of the modules
+        m.algebraic_modules = {
+            k: m.algebraic_modules[k] for k in m._algebraic_module_order
+        }
+    else:
+        if name in m.get_parameter_names():
+            m.update_parameter(name, value)
+        else:
+            m.add_parameter(name, value)
+        # modules that listed it as compound would never be sorted
+        for module in m.algebraic_modules.values():
+            if name in module.compounds:
+                module.compounds.remove(name)
+        m._sort_algebraic_modules()
+    return m
+
+
+def get_inputs(m: Model) -> Dict[str, Any]:
+    """Time dependent inputs of the model with their functions"""
+    return {
+        name[: -len(INPUT_MODULE_SUFFIX)]: module.function
+        for name, module in m.algebraic_modules.items()
+        if name.endswith(INPUT_MODULE_SUFFIX) and module.modifiers == ["time"]
+    }
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+__all__ = ["StepIntegrator", "METHODS"]
+
+import time as _time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from modelbase.ode.integrators import AbstractIntegrator
+from scipy import integrate, optimize
+
+METHODS = {
+    "LSODA": integrate.LSODA,
+    "BDF": integrate.BDF,
+    "Radau": integrate.Radau,
+    "RK45": integrate.RK45,
+    "RK23": integrate.RK23,
+    "DOP853": integrate.DOP853,
+}
+
+
+class StepIntegrator(AbstractIntegrator):
+    """
+    modelbase integrator that steps a scipy OdeSolver by hand.
+
+    The Scipy integrator of modelbase hands the whole interval to odeint, so nothing
+    can look at the solution while it is computed. Here every accepted step passes
+    through python, which lets an observer see the trajectory chunk by chunk.
+
+    BDF is the default, as the scipy LSODA stepper fails to start from (near)
+    steady states of the full model. With method="auto" the solver is chosen per
+    segment from the Jacobian spectrum at its start (see utilities.stiffness); the
+    chosen method and stiffness ratio go into stats.
+
+    Events (zero crossings of event functions, utilities.events) are located
+    exactly on the dense output of the step they happen in.
+    """
+
+    default_integrator_kwargs = {
+        "method": "BDF",
+        "atol": 1e-8,
+        "rtol": 1e-8,
+    }
+
+    # accepted steps collected before the observer is called
+    chunk_size = 256
+
+    def __init__(self, rhs: Callable, y0: Any) -> None:
+        self.rhs = rhs
+        self.t0 = 0.0
+        self.y0 = np.array(y0, dtype=float)
+        self.y0_orig = self.y0.copy()
+        self.kwargs: Dict[str, Any] = self.default_integrator_kwargs.copy()
+        # solver statistics of the last _simulate / _simulate_to_steady_state call
+        self.stats: Optional[Dict[str, Any]] = None
+        # jacobian(t, y), finite differences of rhs if not set
+        self.jacobian: Optional[Callable[[float, np.ndarray], np.ndarray]] = None
+        self._choice: Dict[str, Any] = {}
+
+    def get_integrator_kwargs(self) -> Dict[str, Any]:
+        return {
+            "simulate": self.kwargs.copy(),
+            "simulate_to_steady_state": {"step_size": 100, "max_steps": 1000},
+        }
+
+    def reset(self) -> None:
+        self.t0 = 0.0
+        self.y0 = self.y0_orig.copy()
+
+    def _get_solver(self, t_bound: float, integrator_kwargs: Dict[str, Any]) -> Any:
+        kwargs = {**self.kwargs, **integrator_kwargs}
+        method = kwargs.pop("method")
+        self._choice = {}
+        if method == "auto":
+            from .linearization import jacobian_fd
+            from .stiffness import select_solver
+
+            if self.jacobian is not None:
+                J = self.jacobian(self.t0, self.y0)
+            else:
+                J = jacobian_fd(self.rhs, self.t0, self.y0)
+            choice = select_solver(J, t_bound - self.t0, rtol=kwargs.get("rtol", 1e-8))
+            method = choice["method"]
+            if choice["stiff"] and self.jacobian is not None:
+                kwargs.setdefault("jac", self.jacobian)
+            self._choice = {"auto": True, "stiffness_ratio": choice["stiffness_ratio"]}
+        return METHODS[method](self.rhs, self.t0, self.y0, t_bound, **kwargs)
+
+    def _step(self, solver: Any, record: Dict[str, Any]) -> bool:
+        t_prev = solver.t
+        solver.step()
+        if solver.status == "failed":
+            return False
+        h = solver.t - t_prev
+        record["nsteps"] += 1
+        record["min_step"] = min(record["min_step"], h)
+        record["max_step"] = max(record["max_step"], h)
+        return True
+
+    def _new_record(self, solver: Any) -> Dict[str, Any]:
+        return {
+            "method": type(solver).__name__,
+            "t_start": solver.t,
+            "nsteps": 0,
+            "min_step": np.inf,
+            "max_step": 0.0,
+            "nevents": 0,
+            "wall_time": _time.perf_counter(),
+            **self._choice,
+        }
+
+    def _finish_record(self, solver: Any, record: Dict[str, Any], status: str) -> None:
+        record.update(
+            {
+                "t_end": solver.t,
+                "status": status,
+                "nfev": solver.nfev,
+                "njev": solver.njev,
+                "nlu": solver.nlu,
+                "wall_time": _time.perf_counter() - record["wall_time"],
+            }
+        )
+        if record["nsteps"] == 0:
+            record["min_step"] = np.nan
+        self.stats = record
+
+    def _locate_events(
+        self,
+        solver: Any,
+        events: Any,
+        t_prev: float,
+        g_prev: np.ndarray,
+        g: np.ndarray,
+        record: Dict[str, Any],
+    ) -> None:
+        # sign changes of the event functions over the last step, in time order
+        rising = (g_prev < 0) & (g >= 0)
+        falling = (g_prev > 0) & (g <= 0)
+        hit = (rising & (events.directions >= 0)) | (falling & (events.directions <= 0))
+        if not hit.any():
+            return
+        sol = solver.dense_output()
+        found = []
+        for i in np.flatnonzero(hit):
+            t_event = optimize.brentq(
+                lambda t: events(np.array([t]), sol(t)[None, :])[0, i], t_prev, solver.t
+            )
+            found.append((t_event, i, 1 if rising[i] else -1))
+        for t_event, i, sign in sorted(found):
+            events.found(i, t_event, sol(t_event), sign)
+        record["nevents"] += len(found)
+
+    def _simulate(
+        self,
+        *,
+        t_end: Optional[float] = None,
+        steps: Optional[int] = None,
+        time_points: Optional[Any] = None,
+        observer: Optional[Callable[[np.ndarray, np.ndarray], None]] = None,
+        store: bool = True,
+        events: Optional[Any] = None,
+        **integrator_kwargs: Any,
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Integrate from the current state to t_end.
+
+        Without steps or time_points every accepted step is returned (like CVode
+        with ncp=0). observer is called with (time, y) chunks of accepted steps, the
+        first chunk starting with the initial point. With store=False only the start
+        and end points are returned.
+        events (utilities.events._EventSet) is evaluated after every accepted step;
+        the crossings it finds are passed to events.found with their exact time and
+        state.
+        """
+        if time_points is not None:
+            t_eval = np.asarray(time_points, dtype=float)
+            t_eval = np.concatenate(([self.t0], t_eval[t_eval > self.t0]))
+            t_end = t_eval[-1]
+        elif t_end is None:
+            raise ValueError("You need to supply t_end (+steps) or time_points")
+        elif steps is not None:
+            t_eval = np.linspace(self.t0, t_end, int(steps) + 1)
+        else:
+            t_eval = None
+
+        solver = self._get_solver(t_end, integrator_kwargs)
+        record = self._new_record(solver)
+        time: List[float] = [self.t0]
+        results: List[np.ndarray] = [self.y0.copy()]
+        buffer_t: List[float] = [self.t0]
+        buffer_y: List[np.ndarray] = [self.y0.copy()]
+        eval_idx = 1
+        if events is not None:
+            g_prev = events(np.array([self.t0]), self.y0[None, :])[0]
+
+        while solver.status == "running":
+            t_prev = solver.t
+            if not self._step(solver, record):
+                self._finish_record(solver, record, "failed")
+                return None, None
+            t, y = solver.t, solver.y
+
+            if events is not None:
+                g = events(np.array([t]), y[None, :])[0]
+                self._locate_events(solver, events, t_prev, g_prev, g, record)
+                g_prev = g
+
+            if store and t_eval is None:
+                time.append(t)
+                results.append(y.copy())
+            elif store:
+                stop = np.searchsorted(t_eval, t, side="right")
+                if stop > eval_idx:
+                    sol = solver.dense_output()
+                    time.extend(t_eval[eval_idx:stop])
+                    results.extend(sol(t_eval[eval_idx:stop]).T)
+                    eval_idx = stop
+
+            if observer is not None:
+                buffer_t.append(t)
+                buffer_y.append(y.copy())
+                if len(buffer_t) >= self.chunk_size:
+                    observer(np.array(buffer_t), np.array(buffer_y))
+                    buffer_t, buffer_y = [], []
+
+        if observer is not None and buffer_t:
+            observer(np.array(buffer_t), np.array(buffer_y))
+
+        if not store:
+            time.append(solver.t)
+            results.append(solver.y.copy())
+
+        self._finish_record(solver, record, "ok")
+        self.t0 = solver.t
+        self.y0 = solver.y.copy()
+        return np.array(time), np.array(results)
+
+    def _simulate_to_steady_state(
+        self,
+        *,
+        tolerance: float,
+        integrator_kwargs: Dict[str, Any],
+        simulation_kwargs: Dict[str, Any],
+    ) -> Tuple[Optional[float], Optional[np.ndarray]]:
+        """
+        Same criterion as the modelbase Scipy integrator: the change per step_size
+        below tolerance.
+        """
+        self.reset()
+        step_size = simulation_kwargs.get("step_size", 100)
+        max_steps = simulation_kwargs.get("max_steps", 1000)
+
+        solver = self._get_solver(self.t0 + step_size * max_steps, integrator_kwargs)
+        record = self._new_record(solver)
+        t_check = self.t0 + step_size
+        y_prev = self.y0.copy()
+        while solver.status == "running":
+            if not self._step(solver, record):
+                break
+            if solver.t < t_check:
+                continue
+            sol = solver.dense_output()
+            while t_check <= solver.t:
+                y = sol(t_check)
+                if np.linalg.norm(y - y_prev, ord=2) < tolerance:
+                    self._finish_record(solver, record, "ok")
+                    self.t0, self.y0 = t_check, y
+                    return t_check, y
+                y_prev = y
+                t_check += step_size
+        self._finish_record(solver, record, "failed")
+        return None, None
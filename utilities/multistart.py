@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+__all__ = [
+    "moieties",
+    "sample_initial_states",
+    "integrate_batch",
+    "multistart_steady_states",
+]
+
+import logging
+from typing import Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+from scipy import integrate, sparse
+
+from .conservation import ReducedSystem
+from .linearization import _steps, batched_rhs
+
+logger = logging.getLogger(__name__)
+
+
+def _derived(m: Model, Y: np.ndarray) -> pd.DataFrame:
+    Y = np.atleast_2d(Y)
+    values = m.get_full_concentration_dict(Y, np.zeros(len(Y)))
+    names = [c for c in m.get_derived_compounds() if c in values]
+    return pd.DataFrame(
+        {
+            c: np.broadcast_to(np.asarray(values[c], dtype=float), (len(Y),))
+            for c in names
+        },
+        index=range(len(Y)),
+    )
+
+
+def moieties(m: Model, y: Any, rtol: float = 1e-6) -> pd.DataFrame:
+    """
+    The hand-coded moieties of a model: derived compounds that are a total minus
+    a weighted sum of state compounds (PQred = PQtot - PQ, Pi = Cp - ..., B3, ...).
+
+    Found numerically from the algebraic modules at the state y: a derived compound
+    counts if it is linear in the state compounds with non-positive integer
+    coefficients (so scaled read-outs like PQ_redoxstate or the E_active dependent
+    V1 are left out). Rows are the derived compounds with their "total" and the
+    weights of the state compounds.
+    """
+    compounds = m.get_compounds()
+    if isinstance(y, dict):
+        y = [y[c] for c in compounds]
+    y = np.asarray(y, dtype=float)
+    # linear functions do not care about the step, large steps keep the
+    # weights of the B-states (1e-7) exact
+    h = 1e-3 * np.maximum(np.abs(y), 1e-3)
+    n = len(y)
+    D = _derived(m, np.concatenate([y[None, :], y + np.diag(h), 2 * y[None, :] + 1]))
+    base = D.iloc[0].to_numpy()
+    gradient = (D.iloc[1 : n + 1].to_numpy() - base) / h[:, None]
+    # a linear function predicts its value at a far away point
+    predicted = base + (y + 1) @ gradient
+    far = D.iloc[-1].to_numpy()
+    linear = np.isclose(predicted, far, rtol=rtol, atol=1e-12)
+    weights = -gradient
+    integer = np.all(np.abs(weights - np.round(weights)) < rtol, axis=0)
+    rows = {}
+    for j, name in enumerate(D.columns):
+        w = np.round(weights[:, j])
+        total = base[j] + w @ y
+        if linear[j] and integer[j] and np.all(w >= 0) and np.any(w > 0) and total > 0:
+            rows[name] = {"total": total, **dict(zip(compounds, w))}
+    return pd.DataFrame.from_dict(rows, orient="index", columns=["total", *compounds])
+
+
+def sample_initial_states(
+    m: Model,
+    y: Any,
+    n: int = 100,
+    spread: float = 10.0,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Random initial states that respect the moiety totals of the model.
+
+    Compounds in a moiety are drawn uniformly between 0 and the largest value the
+    total allows; where the draws use up more than a moiety's total, the compounds
+    of that moiety are scaled down to a random fraction of it (scaling down never
+    breaks another moiety). All other compounds are drawn log-uniformly within a
+    factor spread of y.
+    """
+    compounds = m.get_compounds()
+    if isinstance(y, dict):
+        y = [y[c] for c in compounds]
+    y = np.asarray(y, dtype=float)
+    rng = np.random.default_rng(seed)
+    laws = moieties(m, y)
+    W = laws[compounds].to_numpy(dtype=float)
+    totals = laws["total"].to_numpy(dtype=float)
+    bound = W.any(axis=0)
+    with np.errstate(divide="ignore"):
+        caps = np.min(
+            np.where(W > 0, totals[:, None] / W, np.inf), axis=0, initial=np.inf
+        )
+    Y = y * np.exp(rng.uniform(-1, 1, (n, len(y))) * np.log(spread))
+    Y[:, bound] = rng.uniform(0, 1, (n, int(bound.sum()))) * caps[bound]
+    for w, total in zip(W, totals):
+        used = Y @ w
+        target = rng.uniform(0, 1, n) * total
+        factor = np.where(used > total, target / np.maximum(used, 1e-300), 1.0)
+        Y[:, w > 0] *= factor[:, None]
+    return pd.DataFrame(Y, columns=compounds)
+
+
+def integrate_batch(
+    m: Model,
+    Y0: np.ndarray,
+    t_end: float,
+    rtol: float = 1e-6,
+    atol: float = 1e-9,
+) -> np.ndarray:
+    """
+    Integrate many initial states as one system, returns the end states (rows).
+
+    The states are independent, so the Jacobian is block diagonal and all blocks
+    come from one batched evaluation of the model; BDF works with it as a sparse
+    matrix. Samples share the step size, which is fine for running into steady
+    states. If the system fails, its halves are integrated again on their own, down
+    to single rows, so only the rows that fail by themselves come back as NaN.
+    """
+    Y0 = np.asarray(Y0, dtype=float)
+    k, n = Y0.shape
+    Y = _integrate_block(m, Y0, t_end, rtol, atol)
+    if Y is not None:
+        return Y
+    if k == 1:
+        return np.full_like(Y0, np.nan)
+    logger.info("Batch of %d failed, integrating its halves", k)
+    half = k // 2
+    return np.concatenate(
+        [
+            integrate_batch(m, Y0[:half], t_end, rtol, atol),
+            integrate_batch(m, Y0[half:], t_end, rtol, atol),
+        ]
+    )
+
+
+def _integrate_block(
+    m: Model, Y0: np.ndarray, t_end: float, rtol: float, atol: float
+) -> Optional[np.ndarray]:
+    # the rows of Y0 as one block diagonal system, None if it fails
+    k, n = Y0.shape
+
+    def rhs(t: float, z: np.ndarray) -> np.ndarray:
+        return batched_rhs(m, z.reshape(k, n), t).ravel()
+
+    def jac(t: float, z: np.ndarray) -> sparse.csc_matrix:
+        Y = z.reshape(k, n)
+        H = _steps(Y)
+        eye = np.eye(n)
+        plus = (Y[:, None, :] + H[:, None, :] * eye).reshape(-1, n)
+        minus = (Y[:, None, :] - H[:, None, :] * eye).reshape(-1, n)
+        F = batched_rhs(m, np.concatenate([plus, minus]), t)
+        dF = (F[: k * n] - F[k * n :]).reshape(k, n, n) / (2 * H[:, :, None])
+        return sparse.block_diag(list(np.swapaxes(dF, 1, 2)), format="csc")
+
+    try:
+        sol = integrate.solve_ivp(
+            rhs, (0, t_end), Y0.ravel(), method="BDF", jac=jac, rtol=rtol, atol=atol
+        )
+        message = sol.message
+    except Exception as e:  # singular iteration matrix, non-finite states, ...
+        sol, message = None, repr(e)
+    if sol is None or not sol.success or not np.all(np.isfinite(sol.y[:, -1])):
+        if k == 1:
+            logger.warning("Integration failed: %s", message)
+        return None
+    return sol.y[:, -1].reshape(k, n)
+
+
+def _cluster(X: np.ndarray, tol: float) -> np.ndarray:
+    # leader clustering on relative distances, NaN rows get label -1
+    labels = np.full(len(X), -1)
+    leaders: list = []
+    scale = np.nanmax(np.abs(X), axis=0)
+    scale[~(scale > 0)] = 1
+    for i, x in enumerate(X / scale):
+        if not np.all(np.isfinite(x)):
+            continue
+        for label, leader in enumerate(leaders):
+            if np.max(np.abs(x - leader)) < tol:
+                labels[i] = label
+                break
+        else:
+            labels[i] = len(leaders)
+            leaders.append(x)
+    return labels
+
+
+def multistart_steady_states(
+    m: Model,
+    y: Any,
+    n: int = 100,
+    t_end: float = 1e5,
+    spread: float = 10.0,
+    tol: float = 1e-3,
+    seed: int = 0,
+    samples: Optional[pd.DataFrame] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Distinct steady states the model runs into from many initial states.
+
+    n initial states are sampled around y (sample_initial_states), integrated to
+    t_end all at once (integrate_batch), polished with Newton's method and
+    clustered (states within tol relative to the largest value of each compound
+    are the same). Returns the attractors (state, stability, number of samples
+    and basin fraction, largest basin first) and the samples with their initial
+    state and attractor label (-1: did not converge).
+
+        attractors, samples = multistart_steady_states(m, get_stst_y0(m))
+    """
+    compounds = m.get_compounds()
+    if samples is None:
+        samples = sample_initial_states(m, y, n=n, spread=spread, seed=seed)
+    Y0 = samples[compounds].to_numpy(dtype=float)
+    Y = integrate_batch(m, Y0, t_end)
+
+    finals = np.full_like(Y, np.nan)
+    for i, y_end in enumerate(Y):
+        if not np.all(np.isfinite(y_end)):
+            continue
+        # totals of conservation laws (if any) are the ones of the sample
+        y_ss = ReducedSystem(m, y_end).steady_state()
+        if y_ss is not None and min(y_ss.values()) > -1e-9:
+            finals[i] = [y_ss[c] for c in compounds]
+    labels = _cluster(finals, tol)
+
+    rows = []
+    for label in range(labels.max() + 1):
+        members = finals[labels == label]
+        state = members[0]
+        r = ReducedSystem(m, state)
+        lam = np.linalg.eigvals(r.jacobian(0, r.reduce(state)))
+        rows.append(
+            {
+                **dict(zip(compounds, state)),
+                "max_real": float(lam.real.max()),
+                "stable": bool(lam.real.max() < 0),
+                "n_samples": len(members),
+                "basin_fraction": len(members) / len(finals),
+            }
+        )
+    attractors = pd.DataFrame(rows)
+    if len(attractors):
+        order = attractors["n_samples"].sort_values(ascending=False, kind="stable").index
+        relabel = {old: new for new, old in enumerate(order)}
+        attractors = attractors.loc[order].reset_index(drop=True)
+        labels = np.array([relabel.get(label, -1) for label in labels])
+    attractors.index.name = "attractor"
+    samples = samples.copy()
+    samples["attractor"] = labels
+    return attractors, samples
@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+__all__ = ["run_parallel", "scan_parallel"]
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Type, TypeVar
+
+import pandas as pd
+from modelbase.ode import Model
+from modelbase.ode.integrators import AbstractIntegrator
+
+from .integrator import StepIntegrator
+from .simulator import Simulator
+
+T = TypeVar("T")
+
+
+def run_parallel(
+    model: Model,
+    task: Callable[[Any, Any], T],
+    items: Iterable[Any],
+    max_workers: Optional[int] = None,
+    integrator: Type[AbstractIntegrator] = StepIntegrator,
+) -> List[T]:
+    """
+    task(simulator, item) for every item, in a pool of threads.
+
+    Every call gets a fresh Simulator of model. The simulators copy the model before
+    they change a parameter, so tasks never see each other's parameters and model
+    stays as it is. Results are returned in the order of items; the first exception
+    of a task is raised.
+
+        def light_ss(s, pfd):
+            s.initialise(y0)
+            s.update_parameter("pfd", pfd)
+            return s.simulate_to_steady_state()[1]
+
+        y_ss = run_parallel(m, light_ss, [100, 300, 900])
+
+    Threads only run side by side while the GIL is released, i.e. in numpy on larger
+    arrays and in numba compiled models (utilities.compiled); plain python rate laws
+    gain little.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    def run(item: Any) -> T:
+        return task(Simulator(model, integrator=integrator), item)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, items))
+
+
+def scan_parallel(
+    model: Model,
+    y0: Dict[str, float],
+    parameter: str,
+    values: Sequence[float],
+    max_workers: Optional[int] = None,
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """
+    Steady states for every value of a parameter, computed in threads.
+
+    kwargs go to simulate_to_steady_state; values without a steady state are NaN rows.
+    """
+
+    def steady_state(s: Any, value: float) -> Dict[str, float]:
+        s.initialise(y0)
+        s.update_parameter(parameter, value)
+        t, _ = s.simulate_to_steady_state(**kwargs)
+        if t is None:
+            return {}
+        return s.get_new_y0()
+
+    rows = run_parallel(model, steady_state, values, max_workers=max_workers)
+    return pd.DataFrame(rows, index=pd.Index(values, name=parameter))
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+__all__ = ["DerivedParameterGraph", "update_parameters", "incremental_derived_parameters"]
+
+import functools
+import warnings
+from typing import Any, Dict, Iterable, List, Optional
+
+from modelbase.ode import Model
+
+
+class DerivedParameterGraph:
+    """
+    Which derived parameters are computed from which parameters.
+
+    modelbase recomputes every derived parameter whenever one of their inputs changes
+    (and once more at the start of every simulate call). The graph recomputes only
+    the derived parameters downstream of the changed ones, in dependency order:
+    pHstroma only touches Hstroma, kProtonation and the Keq_* that use it, pfd in
+    the plain Matuszynska model only fCBB -> V1, V6, V9, V13, Vst.
+
+        graph = DerivedParameterGraph(m)
+        graph.downstream(["T"])  # ['RT', 'dG_pH', 'Keq_PQred', ...]
+    """
+
+    def __init__(self, model: Model) -> None:
+        self._build(model)
+
+    def _build(self, model: Model) -> None:
+        self.arguments: Dict[str, List[str]] = {
+            name: list(derived["parameters"])
+            for name, derived in model.derived_parameters.items()
+        }
+        self.users: Dict[str, List[str]] = {}
+        for name, arguments in self.arguments.items():
+            for argument in arguments:
+                self.users.setdefault(argument, []).append(name)
+        self.order = self._sort()
+        self._position = {name: i for i, name in enumerate(self.order)}
+        # values the derived parameters were last computed from
+        self._seen: Dict[str, Any] = {
+            p: model.parameters[p] for p in self.users if p in model.parameters
+        }
+
+    def _sort(self) -> List[str]:
+        waiting = {
+            name: len(set(arguments).intersection(self.arguments))
+            for name, arguments in self.arguments.items()
+        }
+        ready = [name for name, n in waiting.items() if n == 0]
+        order = []
+        while ready:
+            name = ready.pop(0)
+            order.append(name)
+            for user in self.users.get(name, []):
+                waiting[user] -= 1
+                if waiting[user] == 0:
+                    ready.append(user)
+        if len(order) < len(self.arguments):
+            cyclic = sorted(set(self.arguments).difference(order))
+            raise ValueError(f"Derived parameters depend on each other: {cyclic}")
+        return order
+
+    def is_current(self, model: Model) -> bool:
+        """False if derived parameters were added, removed or rewired since building"""
+        return self.arguments.keys() == model.derived_parameters.keys() and all(
+            self.arguments[name] == list(derived["parameters"])
+            for name, derived in model.derived_parameters.items()
+        )
+
+    def downstream(self, changed: Iterable[str]) -> List[str]:
+        """Derived parameters depending on any of the changed ones, in dependency order"""
+        affected = set()
+        todo = [p for p in changed if p in self.users]
+        while todo:
+            for user in self.users.get(todo.pop(), []):
+                if user not in affected:
+                    affected.add(user)
+                    todo.append(user)
+        return sorted(affected, key=self._position.__getitem__)
+
+    def changed(self, model: Model) -> List[str]:
+        """Inputs of derived parameters whose value differs from the last update"""
+        parameters = model.parameters
+        return [p for p, value in self._seen.items() if parameters[p] != value]
+
+    def update(self, model: Model, changed: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Recompute the derived parameters downstream of changed, in place.
+
+        Without changed, the inputs are compared to the values of the last update,
+        so parameters changed behind the graph's back (scale_parameter, direct
+        assignments) are picked up as well. Returns the recomputed parameters.
+        """
+        if not self.is_current(model):
+            self._build(model)
+            changed = list(self.users)
+        elif changed is None:
+            changed = self.changed(model)
+        parameters = model.parameters
+        recompute = self.downstream(changed)
+        for name in recompute:
+            derived = model.derived_parameters[name]
+            parameters[name] = derived["function"](
+                *(parameters[p] for p in derived["parameters"])
+            )
+        for p in self._seen:
+            self._seen[p] = parameters[p]
+        return recompute
+
+
+def _installed_graph(model: Model) -> Optional[DerivedParameterGraph]:
+    update = vars(model).get("_update_derived_parameters")
+    if isinstance(update, functools.partial) and isinstance(
+        getattr(update.func, "__self__", None), DerivedParameterGraph
+    ):
+        return update.func.__self__
+    return None
+
+
+def update_parameters(
+    model: Model,
+    parameters: Dict[str, float],
+    graph: Optional[DerivedParameterGraph] = None,
+) -> List[str]:
+    """
+    Set many parameters at once with one recomputation of the affected derived ones.
+
+    Like model.update_parameters, but each derived parameter is computed once, no
+    matter how many of its inputs changed. Uses the graph installed by
+    incremental_derived_parameters if there is one. Returns the recomputed derived
+    parameters.
+    """
+    if graph is None:
+        graph = _installed_graph(model) or DerivedParameterGraph(model)
+    for name, value in parameters.items():
+        if name in model.parameters:
+            model.parameters[name] = value
+        else:
+            warnings.warn(f"Key {name} is not in the model. Adding.")
+            model.add_and_update_parameter(name, value, update_derived=False)
+    return graph.update(model, changed=parameters)
+
+
+def incremental_derived_parameters(model: Model) -> DerivedParameterGraph:
+    """
+    Make the model recompute only the derived parameters whose inputs changed.
+
+    Replaces model._update_derived_parameters, which modelbase calls on every
+    update_parameter and simulate, on this model instance only. Works in place and
+    returns the graph, which can be handed to update_parameters.
+    """
+    graph = DerivedParameterGraph(model)
+    # a partial (and no closure), so model.copy() and pickling carry it along
+    update = functools.partial(graph.update, model)
+    model._update_derived_parameters = update  # type: ignore[method-assign]
+    return graph
@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+__all__ = ["cycle_map", "periodic_steady_state", "cycle_to_periodic"]
+
+import logging
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+from scipy import integrate, linalg
+
+from .conservation import ReducedSystem
+from .parameters import incremental_derived_parameters, update_parameters
+
+logger = logging.getLogger(__name__)
+
+Cycle = Sequence[Tuple[float, Union[float, Dict[str, float]]]]
+
+
+def _segments(cycle: Cycle) -> List[Tuple[float, Dict[str, float]]]:
+    return [
+        (float(duration), dict(p) if isinstance(p, dict) else {"pfd": p})
+        for duration, p in cycle
+    ]
+
+
+def cycle_map(
+    r: ReducedSystem,
+    x: np.ndarray,
+    cycle: Cycle,
+    monodromy: bool = True,
+    method: str = "BDF",
+    rtol: float = 1e-6,
+    atol: float = 1e-9,
+) -> Tuple[np.ndarray, Optional[np.ndarray], np.ndarray, np.ndarray]:
+    """
+    State after one light cycle, and its derivative with respect to the start state.
+
+    cycle is a list of (duration, pfd) or (duration, {parameter: value}); x is the
+    reduced state of r. The derivative (monodromy matrix) is propagated along the
+    accepted steps with the matrix exponential of the Jacobian at the midpoint of
+    every step, which is accurate enough for Newton's method and costs one Jacobian
+    per step instead of one cycle per compound. Returns the end state, the monodromy
+    matrix (None if not asked for), and time and reduced states of all steps.
+    """
+    segments = _segments(cycle)
+    S = np.eye(len(x)) if monodromy else None
+    implicit = method in ("BDF", "Radau", "LSODA")
+    t0 = 0.0
+    times, states = [np.zeros(1)], [np.asarray(x, dtype=float)[None, :]]
+    for duration, parameters in segments:
+        update_parameters(r.model, parameters)
+        sol = integrate.solve_ivp(
+            r.rhs,
+            (t0, t0 + duration),
+            x,
+            method=method,
+            rtol=rtol,
+            atol=atol,
+            **({"jac": r.jacobian} if implicit else {}),
+        )
+        if not sol.success:
+            raise RuntimeError(
+                f"Integration of the cycle failed at t={t0}: {sol.message}"
+            )
+        if S is not None:
+            for k in range(len(sol.t) - 1):
+                h = sol.t[k + 1] - sol.t[k]
+                J = r.jacobian(sol.t[k] + h / 2, (sol.y[:, k] + sol.y[:, k + 1]) / 2)
+                S = linalg.expm(h * J) @ S
+        x = sol.y[:, -1]
+        times.append(sol.t[1:])
+        states.append(sol.y[:, 1:].T)
+        t0 += duration
+    return x, S, np.concatenate(times), np.concatenate(states)
+
+
+def _residual(F: np.ndarray, x: np.ndarray, rtol: float, atol: float) -> float:
+    # < 1 means converged, like the error norm of an integrator
+    return float(np.max(np.abs(F) / (atol + rtol * np.abs(x)), initial=0.0))
+
+
+def _orbit(
+    r: ReducedSystem,
+    x: np.ndarray,
+    t: np.ndarray,
+    X: np.ndarray,
+    iterations: int,
+    residual: float,
+    M: Optional[np.ndarray],
+) -> Dict[str, Any]:
+    states = pd.DataFrame(r.full(X), index=pd.Index(t, name="time"), columns=r.compounds)
+    multipliers = None
+    if M is not None:
+        multipliers = np.linalg.eigvals(M)
+        multipliers = multipliers[np.argsort(-np.abs(multipliers))]
+    return {
+        "y0": dict(zip(r.compounds, r.full(x))),
+        "trajectory": states,
+        "converged": residual < 1,
+        "iterations": iterations,
+        "residual": residual,
+        "floquet_multipliers": multipliers,
+    }
+
+
+def _reduced(model: Model, y0: Any) -> ReducedSystem:
+    # parameters are changed every segment, on a copy with cheap derived updates
+    model = model.copy()
+    incremental_derived_parameters(model)
+    return ReducedSystem(model, y0)
+
+
+def periodic_steady_state(
+    model: Model,
+    y0: Any,
+    cycle: Cycle,
+    rtol: float = 1e-5,
+    atol: float = 1e-8,
+    max_iter: int = 20,
+    method: str = "BDF",
+    integrator_kwargs: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Periodic orbit of the model under a repeated light cycle, by Newton shooting.
+
+    Solves cycle_map(x) = x for the start state x with Newton's method on the
+    cycle map and its monodromy matrix, starting from y0. Conserved totals are
+    kept at their values in y0. Converged when the change over one cycle is below
+    atol + rtol * |x| for every compound; the integrator runs 10 times tighter.
+    Returns a dict with the periodic start state "y0", the "trajectory" of one
+    cycle (states, time from 0 to the period), "converged", "iterations",
+    "residual" (< 1 when converged) and the "floquet_multipliers" (all inside the
+    unit circle for a stable orbit).
+
+        light = [(60, 1200), (60, 40)]  # light_simulation of zoo.ipynb
+        orbit = periodic_steady_state(m, y0, light)
+    """
+    integrator_kwargs = {
+        "rtol": rtol / 10,
+        "atol": atol / 10,
+        **(integrator_kwargs or {}),
+    }
+    r = _reduced(model, y0)
+    x = r.reduce(r.y0)
+    x1, M, t, X = cycle_map(r, x, cycle, method=method, **integrator_kwargs)
+    F = x1 - x
+    residual = _residual(F, x, rtol, atol)
+    iterations = 0
+    while residual >= 1 and iterations < max_iter:
+        iterations += 1
+        n = len(x)
+        dx = np.linalg.lstsq(M - np.eye(n), -F, rcond=None)[0]
+        # stay on the positive side, then halve until the residual goes down
+        negative = dx < 0
+        step = min(1.0, 0.9 * np.min(-x[negative] / dx[negative], initial=np.inf))
+        while True:
+            x_new = x + step * dx
+            x1, M_new, t_new, X_new = cycle_map(
+                r, x_new, cycle, method=method, **integrator_kwargs
+            )
+            F_new = x1 - x_new
+            if np.linalg.norm(F_new) < np.linalg.norm(F) or step < 1 / 16:
+                break
+            step /= 2
+        x, F, M, t, X = x_new, F_new, M_new, t_new, X_new
+        residual = _residual(F, x, rtol, atol)
+        logger.info(
+            "shooting iteration %d: step %.3g, residual %.3g", iterations, step, residual
+        )
+    if residual >= 1:
+        logger.warning(
+            "No periodic orbit after %d iterations, residual %.3g", iterations, residual
+        )
+    return _orbit(r, x, t, X, iterations, residual, M)
+
+
+def cycle_to_periodic(
+    model: Model,
+    y0: Any,
+    cycle: Cycle,
+    rtol: float = 1e-5,
+    atol: float = 1e-8,
+    max_cycles: int = 500,
+    method: str = "BDF",
+    integrator_kwargs: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    The same orbit as periodic_steady_state, by simulating cycle after cycle.
+
+    Stops when one cycle changes the state by less than atol + rtol * |x|. Mainly
+    there to check the shooting against; "iterations" are the simulated cycles.
+    """
+    integrator_kwargs = {
+        "rtol": rtol / 10,
+        "atol": atol / 10,
+        **(integrator_kwargs or {}),
+    }
+    r = _reduced(model, y0)
+    x = r.reduce(r.y0)
+    cycles = 0
+    while True:
+        cycles += 1
+        x1, _, t, X = cycle_map(
+            r, x, cycle, monodromy=False, method=method, **integrator_kwargs
+        )
+        residual = _residual(x1 - x, x, rtol, atol)
+        if residual < 1 or cycles == max_cycles:
+            break
+        x = x1
+    return _orbit(r, x, t, X, cycles, residual, None)
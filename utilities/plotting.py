@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+__all__ = [
+    "lttb",
+    "minmax_buckets",
+    "downsample",
+    "DownsampledLine",
+    "plot_trace",
+    "shade_segments",
+]
+
+from typing import Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.collections import PolyCollection
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Largest-Triangle-Three-Buckets downsampling (Steinarsson 2013).
+
+    Keeps the first and last point and from each of the n_out - 2 buckets in between
+    the point spanning the largest triangle with the previously selected point and
+    the mean of the next bucket.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        if i + 2 < n_out - 1:
+            nxt = slice(edges[i + 1], edges[i + 2])
+            x_c, y_c = x[nxt].mean(), y[nxt].mean()
+        else:
+            x_c, y_c = x[-1], y[-1]
+        area = np.abs(
+            (x[a] - x_c) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (y_c - y[a])
+        )
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+def minmax_buckets(
+    x: np.ndarray, y: np.ndarray, n_out: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keep the minimum and maximum of n_out / 2 equally wide time buckets.
+
+    Unlike LTTB this never misses a peak (e.g. a saturating pulse), which makes it the
+    safer choice for fluorescence traces.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 4:
+        return x, y
+    edges = np.linspace(x[0], x[-1], n_out // 2 + 1)
+    bucket = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, len(edges) - 2)
+    order = np.lexsort((y, bucket))
+    first = np.r_[True, bucket[order][1:] != bucket[order][:-1]]
+    last = np.r_[first[1:], True]
+    idx = np.unique(np.r_[0, order[first], order[last], n - 1])
+    return x[idx], y[idx]
+
+
+def downsample(
+    x: np.ndarray, y: np.ndarray, n_out: int, method: str = "minmax"
+) -> Tuple[np.ndarray, np.ndarray]:
+    if method == "lttb":
+        return lttb(x, y, n_out)
+    if method == "minmax":
+        return minmax_buckets(x, y, n_out)
+    raise ValueError(f"Unknown downsampling method {method}")
+
+
+class DownsampledLine:
+    """
+    Line that only draws the visible window of a long trace at screen resolution.
+
+    Every change of the x-limits (zooming, panning, ax.set_xlim) re-samples the
+    visible part of the full data, so zooming into a single pulse shows all points.
+    """
+
+    def __init__(
+        self,
+        ax: Any,
+        x: Any,
+        y: Any,
+        n_points: Optional[int] = None,
+        method: str = "minmax",
+        **kwargs: Any,
+    ) -> None:
+        self.ax = ax
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.n_points = n_points
+        self.method = method
+        (self.line,) = ax.plot(*self._sample(self.x[0], self.x[-1]), **kwargs)
+        self.cid = ax.callbacks.connect("xlim_changed", self._update)
+
+    def _sample(self, xmin: float, xmax: float) -> Tuple[np.ndarray, np.ndarray]:
+        # one point outside the window on both sides, so the line reaches the border
+        start = max(np.searchsorted(self.x, xmin, side="left") - 1, 0)
+        stop = min(np.searchsorted(self.x, xmax, side="right") + 1, len(self.x))
+        n_out = self.n_points
+        if n_out is None:
+            n_out = 2 * int(self.ax.bbox.width)
+        return downsample(self.x[start:stop], self.y[start:stop], n_out, self.method)
+
+    def _update(self, ax: Any) -> None:
+        self.line.set_data(*self._sample(*ax.get_xlim()))
+        ax.figure.canvas.draw_idle()
+
+    def remove(self) -> None:
+        self.ax.callbacks.disconnect(self.cid)
+        self.line.remove()
+
+
+def plot_trace(
+    ax: Any,
+    x: Any,
+    y: Any = None,
+    n_points: Optional[int] = None,
+    method: str = "minmax",
+    **kwargs: Any,
+) -> DownsampledLine:
+    """
+    Drop-in for ax.plot(c["Fluo"], ...) on long simulations.
+
+    Takes either a series indexed by time or x and y arrays.
+    """
+    if y is None:
+        if not isinstance(x, pd.Series):
+            raise TypeError("Without y, x has to be a pandas Series indexed by time")
+        x, y = x.index, x.values
+    return DownsampledLine(ax, x, y, n_points=n_points, method=method, **kwargs)
+
+
+def shade_segments(
+    segments: pd.DataFrame,
+    axs: Any,
+    column: str = "pfd",
+    min_alpha: float = 0.05,
+    max_alpha: float = 0.2,
+) -> pd.DataFrame:
+    """
+    Shade the background of each segment, lower values darker.
+
+    segments needs the columns start, end and column (see utilities.segments).
+    The values are log1p transformed, normalised to [0, 1] and linearly mapped to
+    [min_alpha, max_alpha]. All spans of an axis are drawn as a single collection.
+    """
+    if not isinstance(axs, (list, tuple, np.ndarray)):
+        axs = [axs]
+    eps = 1e-6  # prevent log(0)
+    transformed = np.log1p(segments[column].to_numpy(dtype=float) + eps)
+    normed = (transformed - transformed.min()) / (
+        transformed.max() - transformed.min() + eps
+    )
+    alphas = min_alpha + (1 - normed) * (max_alpha - min_alpha)
+
+    start = segments["start"].to_numpy(dtype=float)
+    end = segments["end"].to_numpy(dtype=float)
+    verts = np.stack(
+        [
+            np.c_[start, np.zeros_like(start)],
+            np.c_[start, np.ones_like(start)],
+            np.c_[end, np.ones_like(end)],
+            np.c_[end, np.zeros_like(end)],
+        ],
+        axis=1,
+    )
+    colors = np.c_[np.zeros((len(alphas), 3)), alphas]
+    for ax in np.ravel(axs):
+        spans = PolyCollection(
+            verts,
+            facecolors=colors,
+            linewidths=0,
+            transform=ax.get_xaxis_transform(),
+            zorder=0,
+        )
+        ax.add_collection(spans, autolim=False)
+        ax.dataLim.update_from_data_x(np.r_[start, end], ignore=False)
+        ax.autoscale_view(scaley=False)
+    return segments
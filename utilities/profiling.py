@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+__all__ = ["ModelProfiler"]
+
+import functools
+import time
+import warnings
+from typing import Any, Callable, Dict, List, Tuple
+
+import pandas as pd
+from modelbase.ode import Model
+
+
+def _timed(function: Callable, stats: List[float], profiler: "ModelProfiler") -> Callable:
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        if not profiler._active:
+            # a copy of the model made while profiling, after the block
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start
+
+    return wrapper
+
+
+class ModelProfiler:
+    """
+    Opt-in call counts and wall times per rate, algebraic module and derived parameter.
+
+    Only while the context is active the functions of the model are wrapped; they are
+    restored afterwards, so a model that is not profiled runs without any overhead.
+
+        with ModelProfiler(s) as prof:
+            pam_analysis(s)
+        prof.report()
+
+    Profile the simulator rather than its model: a utilities.simulator.Simulator works
+    on its own copy of the model once a parameter changes, and the profiler attaches to
+    that copy (making it first if needed). Copies made from a profiled model inside the
+    block keep counting until it ends and call the plain functions afterwards.
+
+    "other" in the report is the time of the block not spent in the model functions
+    (integrator, modelbase bookkeeping).
+    """
+
+    def __init__(self, model_or_simulator: Any) -> None:
+        if isinstance(model_or_simulator, Model):
+            self.simulator = None
+            self.model = model_or_simulator
+        else:
+            self.simulator = model_or_simulator
+            self.model = model_or_simulator.model
+        self.stats: Dict[Tuple[str, str], List[float]] = {}
+        self.elapsed = 0.0
+        self._originals: List[Tuple[Any, str, Callable]] = []
+        self._start = 0.0
+        self._active = False
+
+    def _wrap(self, kind: str, name: str, owner: Any, attribute: str) -> None:
+        stats = self.stats.setdefault((kind, name), [0, 0.0])
+        if isinstance(owner, dict):
+            original = owner[attribute]
+            owner[attribute] = _timed(original, stats, self)
+        else:
+            original = getattr(owner, attribute)
+            setattr(owner, attribute, _timed(original, stats, self))
+        self._originals.append((owner, attribute, original))
+
+    def __enter__(self) -> "ModelProfiler":
+        if self.simulator is not None:
+            # the copy the simulator would make during the block, made now
+            if hasattr(self.simulator, "_own_model"):
+                self.simulator._own_model()
+            self.model = self.simulator.model
+        for name, rate in self.model.rates.items():
+            self._wrap("rate", name, rate, "function")
+        for name, module in self.model.algebraic_modules.items():
+            self._wrap("algebraic_module", name, module, "function")
+        for name, parameter in self.model.derived_parameters.items():
+            self._wrap("derived_parameter", name, parameter, "function")
+        self._active = True
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.elapsed += time.perf_counter() - self._start
+        self._active = False
+        for owner, attribute, original in reversed(self._originals):
+            if isinstance(owner, dict):
+                owner[attribute] = original
+            else:
+                setattr(owner, attribute, original)
+        self._originals = []
+
+    def report(self) -> pd.DataFrame:
+        """Calls, total and per call time and share of the profiled time, largest first"""
+        report = pd.DataFrame(
+            [
+                (kind, name, int(calls), total)
+                for (kind, name), (calls, total) in self.stats.items()
+            ],
+            columns=["kind", "name", "calls", "total_s"],
+        )
+        if self.elapsed > 0 and report["calls"].sum() == 0:
+            warnings.warn(
+                "No model function was called while profiling. If a simulator ran, it "
+                "worked on a copy of the model: profile the simulator, ModelProfiler(s)."
+            )
+        other = self.elapsed - report["total_s"].sum()
+        report.loc[len(report)] = ["other", "other", 0, max(other, 0.0)]
+        calls = report["calls"].where(report["calls"] > 0)
+        report["per_call_us"] = 1e6 * report["total_s"] / calls
+        report["share"] = report["total_s"] / report["total_s"].sum()
+        return report.sort_values("total_s", ascending=False).set_index(["kind", "name"])
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+__all__ = ["Y0", "get_stst_y0", "pam_analysis", "pirk", "pfd_ss_scan"]
+
+import itertools as it
+import logging
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from modelbase.ode.simulators import default_integrator
+from modelbase.ode.simulators.simulator import _Simulate
+
+from .simulator import Simulator
+
+logger = logging.getLogger(__name__)
+
+# Steady state of the original model at pfd 800. Compounds a model lacks are ignored.
+Y0 = {
+    "PQ": 7.9748184613444275,
+    "PC": 3.57108813007692,
+    "Fd": 1.721696341225566,
+    "ATP": 1.8936718777506976,
+    "NADPH": 0.6788108516140969,
+    "H": 0.004802502492550202,
+    "LHC": 0.6969473105113153,
+    "Psbs": 0.7674559928090664,
+    "Vx": 0.33370273249937626,
+    "PGA": 1.35339320630429,
+    "BPGA": 0.001210512840897971,
+    "GAP": 0.01575251285636341,
+    "DHAP": 0.346555191748089,
+    "FBP": 0.03875970146177038,
+    "F6P": 1.7636781722849098,
+    "G6P": 4.056459794959748,
+    "G1P": 0.23527466807499517,
+    "SBP": 0.21539487281695865,
+    "S7P": 0.2980600536159056,
+    "E4P": 0.047810099035570125,
+    "X5P": 0.04881224690913804,
+    "R5P": 0.08176050965246137,
+    "RUBP": 0.5637405774508513,
+    "RU5P": 0.03270420319369181,
+    "P700FA": 1.5773834520316117,
+    "P700+FA-": 0.017015497519751573,
+    "P700FA-": 0.0278690554094764,
+    "B0": 1.9770731028776223,
+    "B1": 9.993346909605244e-08,
+    "B2": 0.5229267163470579,
+    "MDA": 2.827838963821763e-05,
+    "H2O2": 1.651088578343372e-05,
+    "DHA": 1.9875782499986854e-07,
+    "GSSG": 9.64227889697731e-08,
+    "TR_ox": 0.6912357389136846,
+    "E_inactive": 1.467838696087237,
+}
+
+
+def get_stst_y0(
+    model_or_simulator: Any, pfd: float = 800, atlas: Any = None
+) -> Optional[Dict[str, float]]:
+    """
+    Returns the initial conditions for the model.
+    The values are based on the original model and need to be adjusted for each new model.
+    Therefore we quickly simulate the model to steady state.
+    With a SteadyStateAtlas of the model (utilities.atlas) the simulation starts from
+    its interpolated steady state at pfd instead of Y0, which is a lot quicker.
+    A model is not changed (the simulator sets pfd on its own copy); a simulator is
+    left at pfd.
+    """
+    if not isinstance(model_or_simulator, _Simulate):
+        # modelbase's integrator, which gets to steady state from Y0 at low light too
+        s = Simulator(model_or_simulator, integrator=default_integrator)
+    else:
+        s = model_or_simulator
+
+    s.initialise(Y0 if atlas is None else atlas.interpolate(pfd=pfd))
+    s.update_parameter("pfd", pfd)
+    s.simulate_to_steady_state()
+    return s.get_new_y0()
+
+
+def pam_analysis(
+    s: Any,
+    t_relax: float = 120,
+    t_pulse: float = 0.8,
+    pfd_dark: float = 50,
+    pfd_illumination: float = 1000,
+    pfd_pulse: float = 5000,
+    integrator_kwargs: Optional[Dict[str, Any]] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """PAM protocol of PAM-analysis.ipynb: 2 dark, 10 light, 8 dark relax/pulse pairs"""
+    if integrator_kwargs is None:
+        integrator_kwargs = {}
+    t = it.accumulate(it.chain.from_iterable((t_relax, t_pulse) for i in range(32)))
+    pfds = list(
+        [pfd_dark, pfd_pulse] * 2
+        + [pfd_illumination, pfd_pulse] * 10
+        + [pfd_dark, pfd_pulse] * 8
+    )
+    for t_end, pfd in zip(t, pfds):
+        s.update_parameter("pfd", pfd)
+        s.simulate(t_end, **integrator_kwargs)
+    return s.get_full_results_df(), s.get_fluxes_df()
+
+
+def pirk(
+    s: Any,
+    pre_pfd: float = 100,
+    dark_pfd: float = 5,
+    pulse_pfd: float = 1000,
+    pulse_time: float = 0.003,
+    relax_time: float = 0.06,
+    number_of_pulses: int = 4,
+    atlas: Any = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    PIRK protocol of PIRK.ipynb (new_PIRK): steady state (light) -> light pulses (fast).
+    Time is shifted so the pulses start at 0. atlas is passed on to get_stst_y0.
+    """
+    y0 = get_stst_y0(s, pfd=pre_pfd, atlas=atlas)
+    if y0 is None:
+        raise ValueError("Modelbase says NO")
+    s.initialise(y0)
+
+    pfds = [pre_pfd] + list([pulse_pfd, dark_pfd] * number_of_pulses)
+    time_points = list(it.accumulate([10] + [pulse_time, relax_time] * number_of_pulses))
+    for t, pfd in zip(time_points, pfds):
+        s.update_parameter("pfd", pfd)
+        s.simulate(t)
+
+    c = s.get_full_results_df()
+    v = s.get_fluxes_df()
+    c.index = c.index - 10
+    v.index = v.index - 10
+    return c, v
+
+
+def pfd_ss_scan(
+    s: Any,
+    pfd_values: Iterable[float],
+    y0_loop: Dict[str, float],
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Steady states along pfd_values (steady_state_analysis.ipynb), each starting
+    from the previous one. Failed points are NaN.
+    """
+    fluxes = {}
+    concentrations = {}
+    failed_cases = []
+    for x in pfd_values:
+        s.initialise(y0_loop)
+        s.update_parameter("pfd", x)
+        try:
+            t, y = s.simulate_to_steady_state()
+            if y is None or len(y) == 0:
+                raise ValueError(f"Simulation returned empty result at pfd={x}")
+            concentrations[x] = s.get_full_results_array()[-1]
+            fluxes[x] = s.model.get_fluxes_array(y=y, t=t)[-1]
+            y0_loop = s.get_new_y0()
+        except Exception as e:
+            logger.warning(f"Simulation failed at pfd={x}: {e}")
+            failed_cases.append(x)
+            concentrations[x] = np.full(len(s.model.get_all_compounds()), np.nan)
+            fluxes[x] = np.full(len(s.model.get_rate_names()), np.nan)
+    logger.info(f"Simulation completed. {len(failed_cases)} cases failed: {failed_cases}")
+    return (
+        pd.DataFrame(concentrations, index=s.model.get_all_compounds()).T,
+        pd.DataFrame(fluxes, index=s.model.get_rate_names()).T,
+    )
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+__all__ = ["FAST_SUBSYSTEMS", "qssa_solution", "quasi_steady_state"]
+
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from modelbase.ode import Model
+
+# state compounds of the fast subsystems of the later model variants.
+# B3 and P700+FA are computed from these by moieties and are replaced as well.
+FAST_SUBSYSTEMS = {
+    "PSII": ["B0", "B1", "B2"],
+    "PSI": ["P700FA", "P700+FA-", "P700FA-"],
+}
+
+
+def _fast_compounds(m: Model, fast: Union[str, Sequence[str]]) -> List[str]:
+    fast = FAST_SUBSYSTEMS[fast] if isinstance(fast, str) else list(fast)
+    missing = [c for c in fast if c not in m.get_compounds()]
+    if missing:
+        raise ValueError(f"Not state compounds of the model: {missing}")
+    return fast
+
+
+class _Symbols(dict):
+    """Model names to sympy symbols (names like P700+FA- are no valid identifiers)"""
+
+    def __missing__(self, name: str) -> Any:
+        import sympy
+
+        self[name] = sympy.Symbol(f"_x{len(self)}")
+        return self[name]
+
+
+def _fast_system(
+    m: Model, fast: List[str]
+) -> Tuple[Dict[str, Any], Dict[str, Any], List[str], List[str], _Symbols]:
+    """
+    Symbolic rhs of the fast compounds and the modules that only depend on them.
+
+    Returns the rhs, the expressions of the eliminated derived compounds, the names
+    of the rates and modules to remove, and the symbol table.
+    """
+    symbols = _Symbols()
+    # derived compounds that are functions of the fast compounds and parameters only
+    # (B3_alm, P700+FA_alm) are substituted and replaced
+    derived: Dict[str, Any] = {}
+    removed_modules = []
+    known = set(fast)
+    for name in m._algebraic_module_order:
+        module = m.algebraic_modules[name]
+        inputs = set(module.compounds) | set(module.modifiers)
+        if inputs and inputs <= known and len(module.derived_compounds) == 1:
+            args = [derived.get(a, symbols[a]) for a in module.args]
+            derived[module.derived_compounds[0]] = module.function(*args)
+            known.update(module.derived_compounds)
+            removed_modules.append(name)
+
+    rhs = {c: 0 for c in fast}
+    removed_rates = []
+    used = set()
+    for rate_name, stoichiometry in m.stoichiometries.items():
+        if not set(stoichiometry).intersection(fast):
+            continue
+        rate = m.rates[rate_name]
+        used.update(rate.args)
+        v = rate.function(*[derived.get(a, symbols[a]) for a in rate.args])
+        for compound, n in stoichiometry.items():
+            if compound in rhs:
+                rhs[compound] += n * v
+        if set(stoichiometry) <= set(fast):
+            removed_rates.append(rate_name)
+
+    # only the moieties the fast rates need are replaced, the others (rel_B0, ...)
+    # keep reading the fast compounds, now computed by the QSSA module
+    removed_modules = [
+        name
+        for name in removed_modules
+        if used.intersection(m.algebraic_modules[name].derived_compounds)
+    ]
+    derived = {
+        c: e
+        for c, e in derived.items()
+        if any(c in m.algebraic_modules[n].derived_compounds for n in removed_modules)
+    }
+    return rhs, derived, removed_rates, removed_modules, symbols
+
+
+def qssa_solution(m: Model, fast: Union[str, Sequence[str]]) -> Dict[str, Any]:
+    """
+    Quasi steady state of the fast compounds as sympy expressions of the model names.
+
+    The rhs of the fast compounds has to be linear in them (true for the PSII and PSI
+    state models, whose moieties are already taken care of by B3_alm / P700+FA_alm),
+    the linear system is solved symbolically.
+    """
+    import sympy
+
+    fast = _fast_compounds(m, fast)
+    rhs, derived, *_, symbols = _fast_system(m, fast)
+    x = [symbols[c] for c in fast]
+    f = sympy.Matrix([sympy.expand(rhs[c]) for c in fast])
+    A = f.jacobian(x)
+    if A.free_symbols.intersection(x):
+        raise ValueError(
+            f"The rhs of {fast} is not linear in them, no linear QSSA possible"
+        )
+    b = f - A * sympy.Matrix(x)
+    b = b.subs({xi: 0 for xi in x})
+    if A.rank(simplify=True) < len(fast):
+        raise ValueError(
+            f"The fast system of {fast} is singular, "
+            "leave out one compound of each moiety"
+        )
+    solution = dict(zip(fast, A.LUsolve(-b)))
+    for compound, expression in derived.items():
+        solution[compound] = expression.subs({symbols[c]: solution[c] for c in fast})
+    names = {s: sympy.Symbol(n) for n, s in symbols.items()}
+    return {c: e.xreplace(names) for c, e in solution.items()}
+
+
+def _vectorized(function: Callable) -> Callable:
+    def qssa(*args: Any) -> np.ndarray:
+        return np.array(np.broadcast_arrays(*function(*args)), dtype=float)
+
+    return qssa
+
+
+def quasi_steady_state(
+    m: Model,
+    fast: Union[str, Sequence[str]],
+    module_name: Optional[str] = None,
+) -> Model:
+    """
+    Copy of the model with the fast compounds replaced by their quasi steady state.
+
+    fast is a list of state compounds or a key of FAST_SUBSYSTEMS ("PSII", "PSI").
+    Reactions that only act on the fast compounds are removed, the others keep their
+    stoichiometry on the slow compounds. The solution is one algebraic module
+    (default name "<fast>_qssa") that computes the fast compounds and the moieties
+    depending on them, so everything downstream (rel_B0, fluorescence, ...) is unchanged.
+
+        m_qssa = quasi_steady_state(get_model(), "PSII")
+    """
+    import sympy
+
+    if module_name is None:
+        module_name = f"{fast if isinstance(fast, str) else '_'.join(fast)}_qssa"
+    fast = _fast_compounds(m, fast)
+    _, derived, removed_rates, removed_modules, _ = _fast_system(m, fast)
+    solution = qssa_solution(m, fast)
+    outputs = fast + list(derived)
+
+    args = sorted({s.name for e in solution.values() for s in e.free_symbols})
+    all_compounds = set(m.get_all_compounds())
+    compounds = [a for a in args if a in all_compounds]
+    parameters = [a for a in args if a not in all_compounds]
+    symbols = [sympy.Symbol(a) for a in compounds + parameters]
+    safe = [sympy.Symbol(f"_x{i}") for i in range(len(symbols))]
+    expressions = [solution[c].xreplace(dict(zip(symbols, safe))) for c in outputs]
+    function = sympy.lambdify(safe, expressions, modules="numpy", cse=True)
+
+    new = m.copy()
+    new.remove_reactions(removed_rates)
+    for rate_name, stoichiometry in list(new.stoichiometries.items()):
+        if set(stoichiometry).intersection(fast):
+            new.update_stoichiometry(
+                rate_name, {k: v for k, v in stoichiometry.items() if k not in fast}
+            )
+    # sorting with the fast compounds half removed would not terminate
+    for name in removed_modules:
+        new.remove_algebraic_module(name, sort_modules=False)
+    new.remove_compounds(fast)
+    new.add_algebraic_module(
+        module_name=module_name,
+        function=_vectorized(function),
+        compounds=compounds,
+        derived_compounds=outputs,
+        parameters=parameters,
+    )
+    # modelbase labels the full results in insertion order of the modules but
+    # computes them in sorted order, so the two have to agree
+    new.algebraic_modules = {
+        k: new.algebraic_modules[k] for k in new._algebraic_module_order
+    }
+    return new
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+__all__ = ["Reducer", "TimeAverage", "Integral", "Minimum", "Maximum", "Last"]
+
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class Reducer:
+    """
+    Accumulates a summary of some variables while a simulation runs.
+
+    Values are fed in chunks of (time, {variable: values}) and only the part inside
+    [t_start, t_end] counts. The last point of a chunk is kept so the next chunk can
+    be bridged, and the window borders are linearly interpolated.
+    """
+
+    def __init__(
+        self,
+        variables: List[str],
+        t_start: Optional[float] = None,
+        t_end: Optional[float] = None,
+    ) -> None:
+        self.variables = list(variables)
+        self.t_start = -np.inf if t_start is None else t_start
+        self.t_end = np.inf if t_end is None else t_end
+        self.reset()
+
+    def reset(self) -> None:
+        self._prev_t: Optional[float] = None
+        self._prev_x: Optional[np.ndarray] = None
+
+    def update(self, time: np.ndarray, values: Dict[str, np.ndarray]) -> None:
+        t = np.asarray(time, dtype=float)
+        x = np.column_stack([np.asarray(values[v], dtype=float) for v in self.variables])
+        if self._prev_t is not None:
+            t = np.concatenate(([self._prev_t], t))
+            x = np.vstack((self._prev_x, x))
+        self._prev_t, self._prev_x = t[-1], x[-1]
+
+        t, x = self._clip(t, x)
+        if len(t) > 0:
+            self._accumulate(t, x)
+
+    def _clip(self, t: np.ndarray, x: np.ndarray):
+        if t[-1] < self.t_start or t[0] > self.t_end:
+            return t[:0], x[:0]
+        mask = (t > self.t_start) & (t < self.t_end)
+        borders = [b for b in (self.t_start, self.t_end) if t[0] <= b <= t[-1]]
+        if borders:
+            x_b = np.column_stack([np.interp(borders, t, col) for col in x.T])
+            t = np.concatenate((t[mask], borders))
+            x = np.vstack((x[mask], x_b))
+            order = np.argsort(t, kind="stable")
+            t, x = t[order], x[order]
+        else:
+            t, x = t[mask], x[mask]
+        return t, x
+
+    def _accumulate(self, t: np.ndarray, x: np.ndarray) -> None:
+        raise NotImplementedError
+
+    def _result(self) -> np.ndarray:
+        raise NotImplementedError
+
+    def get_result(self) -> pd.Series:
+        return pd.Series(self._result(), index=self.variables)
+
+
+class Integral(Reducer):
+    """Trapezoidal integral over the window"""
+
+    def reset(self) -> None:
+        super().reset()
+        self.integral = np.zeros(len(self.variables))
+        self.duration = 0.0
+
+    def _accumulate(self, t: np.ndarray, x: np.ndarray) -> None:
+        dt = np.diff(t)
+        self.integral += (dt[:, None] * (x[1:] + x[:-1]) / 2).sum(axis=0)
+        self.duration += dt.sum()
+
+    def _result(self) -> np.ndarray:
+        return self.integral
+
+
+class TimeAverage(Integral):
+    """Time-weighted mean over the window"""
+
+    def _result(self) -> np.ndarray:
+        if self.duration == 0:
+            return np.full(len(self.variables), np.nan)
+        return self.integral / self.duration
+
+
+class Minimum(Reducer):
+    def reset(self) -> None:
+        super().reset()
+        self.value = np.full(len(self.variables), np.inf)
+
+    def _accumulate(self, t: np.ndarray, x: np.ndarray) -> None:
+        self.value = np.minimum(self.value, x.min(axis=0))
+
+    def _result(self) -> np.ndarray:
+        return np.where(np.isinf(self.value), np.nan, self.value)
+
+
+class Maximum(Reducer):
+    def reset(self) -> None:
+        super().reset()
+        self.value = np.full(len(self.variables), -np.inf)
+
+    def _accumulate(self, t: np.ndarray, x: np.ndarray) -> None:
+        self.value = np.maximum(self.value, x.max(axis=0))
+
+    def _result(self) -> np.ndarray:
+        return np.where(np.isinf(self.value), np.nan, self.value)
+
+
+class Last(Reducer):
+    """Last value inside the window"""
+
+    def reset(self) -> None:
+        super().reset()
+        self.value = np.full(len(self.variables), np.nan)
+
+    def _accumulate(self, t: np.ndarray, x: np.ndarray) -> None:
+        self.value = x[-1].copy()
+
+    def _result(self) -> np.ndarray:
+        return self.value
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+__all__ = [
+    "get_segments",
+    "segments_from_trace",
+    "get_parameter_trace",
+    "get_parameter_traces",
+]
+
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+
+def get_segments(
+    s: Any,
+    parameters: Iterable[str] = ("pfd",),
+    shift: float = 0.0,
+    merge: bool = True,
+) -> pd.DataFrame:
+    """
+    One row (start, end, *parameters) per simulate call of a simulator.
+
+    Built from s.simulation_parameters and the per-segment time arrays, so nothing
+    has to be evaluated per time point. A segment starts where the previous one
+    ended. With merge consecutive segments with equal parameter values are joined.
+    shift is subtracted from all times (e.g. the pre-phase of a PIRK).
+    """
+    parameters = list(parameters)
+    times = s.get_time(concatenated=False)
+    if times is None:
+        return pd.DataFrame(columns=["start", "end", *parameters])
+    ends = np.array([t[-1] for t in times], dtype=float)
+    starts = np.r_[times[0][0], ends[:-1]]
+    segments = pd.DataFrame(
+        [[p[k] for k in parameters] for p in s.simulation_parameters],
+        columns=parameters,
+    )
+    segments.insert(0, "start", starts - shift)
+    segments.insert(1, "end", ends - shift)
+    if merge:
+        segments = _merge(segments, parameters)
+    return segments
+
+
+def get_parameter_trace(s: Any, name: str) -> np.ndarray:
+    """Value of a parameter at every returned time point, repeated per segment"""
+    times = s.get_time(concatenated=False)
+    if times is None:
+        return np.array([], dtype=float)
+    lengths = [len(t) for t in times]
+    values = [p[name] for p in s.simulation_parameters]
+    return np.repeat(np.asarray(values, dtype=float), lengths)
+
+
+def get_parameter_traces(s: Any, names: Iterable[str] = ("pfd",)) -> pd.DataFrame:
+    """Parameter traces indexed by time, e.g. to join them to get_full_results_df()"""
+    return pd.DataFrame(
+        {name: get_parameter_trace(s, name) for name in names},
+        index=pd.Index(s.get_time(), name="time"),
+    )
+
+
+def segments_from_trace(trace: pd.Series, name: str = "pfd") -> pd.DataFrame:
+    """
+    Segments from a time-indexed trace of a piecewise constant value.
+
+    For results that only carry the value per time point (e.g. old frames with an
+    "L" column).
+    """
+    t = trace.index.to_numpy(dtype=float)
+    values = trace.to_numpy()
+    change = np.flatnonzero(values[1:] != values[:-1]) + 1
+    ends = t[np.r_[change - 1, len(t) - 1]]
+    return pd.DataFrame(
+        {
+            "start": np.r_[t[0], ends[:-1]],
+            "end": ends,
+            name: values[np.r_[0, change]],
+        }
+    )
+
+
+def _merge(segments: pd.DataFrame, parameters: list) -> pd.DataFrame:
+    values = segments[parameters].to_numpy()
+    new = np.r_[True, (values[1:] != values[:-1]).any(axis=1)]
+    group = np.cumsum(new) - 1
+    merged = segments[new].reset_index(drop=True)
+    merged["end"] = segments.groupby(group)["end"].max().to_numpy()
+    return merged
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+__all__ = ["SegmentSimulator", "Simulator"]
+
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+from modelbase.ode.integrators import AbstractIntegrator
+from modelbase.ode.simulators.simulator import _Simulate
+
+from .events import Event, _EventSet
+from .integrator import StepIntegrator
+from .linearization import model_jacobian
+from .parameters import incremental_derived_parameters, update_parameters
+from .reducers import Reducer
+from .segments import get_parameter_trace, get_segments
+
+
+class SegmentSimulator(_Simulate):
+    """
+    modelbase Simulator with reducers that are fed while the model is integrated.
+
+    Reducers see every accepted integration step of every simulate call, so averages,
+    extrema and integrals are available without keeping the trajectories around
+    (simulate(..., store=False) keeps only the first and last point of a segment).
+    Events (utilities.events) are located by the integrator in the same way, at
+    their exact time. Solver statistics of every segment are kept next to
+    simulation_parameters.
+
+    Simulators share the model they are given until they change it: the first
+    update_parameter(s) call works on a private copy (copy on write), so several
+    simulators of one model can run side by side, e.g. in threads (utilities.parallel).
+    The copy only recomputes the derived parameters affected by a change
+    (utilities.parameters).
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        integrator: Type[AbstractIntegrator] = StepIntegrator,
+        y0: Optional[Any] = None,
+        time: Optional[List[np.ndarray]] = None,
+        results: Optional[List[np.ndarray]] = None,
+        parameters: Optional[List[Dict[str, float]]] = None,
+    ) -> None:
+        self.reducers: Dict[str, Reducer] = {}
+        self.events: Dict[str, Event] = {}
+        self.integrator_stats: List[Dict[str, Any]] = []
+        self._owns_model = False
+        super().__init__(
+            model=model,
+            integrator=integrator,
+            y0=y0,
+            time=time,
+            results=results,
+            parameters=parameters,
+        )
+
+    def _own_model(self) -> None:
+        if self._owns_model:
+            return
+        # the integrators evaluate self._rhs, so they follow the copy, also those that
+        # fix their rhs when they are built (Assimulo)
+        self.model = self.model.copy()
+        self._owns_model = True
+        incremental_derived_parameters(self.model)
+
+    def update_parameter(
+        self,
+        parameter_name: str,
+        parameter_value: float,
+        **meta_info: Dict[str, Any],
+    ) -> None:
+        self._own_model()
+        super().update_parameter(parameter_name, parameter_value, **meta_info)
+
+    def update_parameters(self, parameters: Dict[str, float]) -> None:
+        # one recomputation of the affected derived parameters for all changes
+        self._own_model()
+        update_parameters(self.model, parameters)
+
+    def add_reducer(self, name: str, reducer: Reducer) -> None:
+        self.reducers[name] = reducer
+
+    def remove_reducer(self, name: str) -> None:
+        del self.reducers[name]
+
+    def reset_reducers(self) -> None:
+        for reducer in self.reducers.values():
+            reducer.reset()
+
+    def get_reduced(self, name: Optional[str] = None):
+        """Result of one reducer (Series) or of all (DataFrame, one row per reducer)"""
+        if name is not None:
+            return self.reducers[name].get_result()
+        return pd.DataFrame({k: v.get_result() for k, v in self.reducers.items()}).T
+
+    def add_event(self, name: str, event: Event) -> None:
+        self.events[name] = event
+
+    def remove_event(self, name: str) -> None:
+        del self.events[name]
+
+    def reset_events(self) -> None:
+        for event in self.events.values():
+            event.reset()
+
+    def get_events(self, name: Optional[str] = None) -> pd.DataFrame:
+        """Occurrences of one event or of all of them (with an event column), by time"""
+        if name is not None:
+            return self.events[name].get_result()
+        frames = [event.get_result().assign(event=k) for k, event in self.events.items()]
+        if not frames:
+            return pd.DataFrame(columns=["time", "kind", "where", "event"])
+        return pd.concat(frames, ignore_index=True).sort_values("time", kind="stable")
+
+    def get_segments(
+        self, parameters: Any = ("pfd",), shift: float = 0.0, merge: bool = True
+    ) -> pd.DataFrame:
+        return get_segments(self, parameters=parameters, shift=shift, merge=merge)
+
+    def get_parameter_trace(self, name: str) -> np.ndarray:
+        return get_parameter_trace(self, name)
+
+    def get_integrator_stats(self, parameters: Any = ("pfd",)) -> pd.DataFrame:
+        """Solver statistics per segment (nfev, njev, nlu, steps, step sizes, time)"""
+        stats = pd.DataFrame(self.integrator_stats)
+        if self.simulation_parameters is not None:
+            for name in parameters:
+                stats[name] = [p[name] for p in self.simulation_parameters]
+        stats.index.name = "segment"
+        return stats
+
+    def _rhs(self, t: Any, y: Any) -> np.ndarray:
+        return self.model._get_rhs(t, y)
+
+    def _initialise_integrator(self, *, y0: Any) -> None:
+        # the rhs of whatever model the simulator has at the time of the call
+        self.integrator = self._integrator(rhs=self._rhs, y0=y0)
+        if isinstance(self.integrator, StepIntegrator):
+            self.integrator.jacobian = self._jacobian
+
+    def _jacobian(self, t: float, y: np.ndarray) -> np.ndarray:
+        # all perturbed states in one batch, much cheaper than column by column
+        return model_jacobian(self.model, y, t)
+
+    def _save_integrator_stats(self) -> None:
+        self.integrator_stats.append(dict(getattr(self.integrator, "stats", None) or {}))
+
+    def clear_results(self) -> None:
+        super().clear_results()
+        self.reset_reducers()
+        self.reset_events()
+        self.integrator_stats = []
+
+    def _observe(self, time: np.ndarray, y: np.ndarray) -> None:
+        needed = {v for r in self.reducers.values() for v in r.variables}
+        values = self.model.get_full_concentration_dict(y=y, t=time)
+        rates = needed.intersection(self.model.get_rate_names())
+        if rates:
+            if len(time) == 1:
+                fluxes = self.model._get_fluxes(fcd=values)
+            else:
+                fluxes = self.model._get_fluxes_array(fcd=values)
+            values.update({k: np.ones(len(time)) * fluxes[k] for k in rates})
+        for reducer in self.reducers.values():
+            reducer.update(time, values)
+
+    def simulate(
+        self,
+        t_end: Optional[float] = None,
+        steps: Optional[int] = None,
+        time_points: Optional[Any] = None,
+        store: bool = True,
+        **integrator_kwargs: Any,
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        if self.reducers:
+            integrator_kwargs["observer"] = self._observe
+        if not store:
+            integrator_kwargs["store"] = False
+        events = None
+        if isinstance(self.integrator, StepIntegrator):
+            parameters = self.model.get_parameters()
+            active = [e for e in self.events.values() if e.active(parameters)]
+            if active:
+                events = integrator_kwargs["events"] = _EventSet(self.model, active)
+        time, results = super().simulate(
+            t_end=t_end,
+            steps=steps,
+            time_points=time_points,
+            **integrator_kwargs,
+        )
+        if time is not None:
+            self._save_integrator_stats()
+            if events is not None:
+                events.finish(time, results)
+        return time, results
+
+    def simulate_to_steady_state(
+        self,
+        tolerance: float = 1e-8,
+        simulation_kwargs: Optional[Dict[str, Any]] = None,
+        **integrator_kwargs: Any,
+    ) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        time, results = super().simulate_to_steady_state(
+            tolerance=tolerance,
+            simulation_kwargs=simulation_kwargs,
+            **integrator_kwargs,
+        )
+        if time is not None:
+            self._save_integrator_stats()
+        return time, results
+
+
+def Simulator(
+    model: Model,
+    integrator: Type[AbstractIntegrator] = StepIntegrator,
+    y0: Optional[Any] = None,
+    time: Optional[List[np.ndarray]] = None,
+    results: Optional[List[np.ndarray]] = None,
+    parameters: Optional[List[Dict[str, float]]] = None,
+) -> SegmentSimulator:
+    """Drop-in replacement for modelbase.ode.Simulator"""
+    return SegmentSimulator(
+        model=model,
+        integrator=integrator,
+        y0=y0,
+        time=time,
+        results=results,
+        parameters=parameters,
+    )
@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+__all__ = [
+    "scan_jacobians",
+    "eigen_spectrum",
+    "participation_factors",
+    "timescale_analysis",
+]
+
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+
+from .linearization import _steps, model_jacobian, stoichiometric_matrix
+from .parameters import incremental_derived_parameters, update_parameters
+
+
+def scan_jacobians(m: Model, states: pd.DataFrame, parameter: str = "pfd") -> np.ndarray:
+    """
+    Jacobians at every point of a steady state scan, shape (points, compounds, compounds).
+
+    states is indexed by the values of parameter and has (at least) the state
+    compounds as columns, e.g. the concentrations of pfd_ss_scan. Rows with NaN
+    (failed points) give NaN Jacobians.
+
+    The 2n central difference states of all points go through the model in one
+    batch, each with its own parameter value (the parameter is set to an array).
+    Models whose rates or derived parameters cannot take that are done point by point.
+    """
+    m = m.copy()
+    incremental_derived_parameters(m)
+    Y = states[m.get_compounds()].to_numpy(dtype=float)
+    J = np.full((len(Y), Y.shape[1], Y.shape[1]), np.nan)
+    finite = np.all(np.isfinite(Y), axis=1)
+    if not finite.any():
+        return J
+    values = states.index.to_numpy(dtype=float)[finite]
+    batched = _batched_jacobians(m, Y[finite], values, parameter)
+    if batched is not None:
+        J[finite] = batched
+        return J
+    for k, (value, y) in zip(np.flatnonzero(finite), zip(values, Y[finite])):
+        update_parameters(m, {parameter: value})
+        J[k] = model_jacobian(m, y)
+    return J
+
+
+def _batched_jacobians(
+    m: Model, Y: np.ndarray, values: np.ndarray, parameter: str
+) -> Optional[np.ndarray]:
+    # central differences of all rows of Y, row k at parameter values[k]; None if the
+    # model does not vectorize over the parameter
+    k, n = Y.shape
+    H = _steps(Y)
+    eye = np.eye(n)
+    plus = (Y[:, None, :] + H[:, None, :] * eye).reshape(-1, n)
+    minus = (Y[:, None, :] - H[:, None, :] * eye).reshape(-1, n)
+    states = np.concatenate([plus, minus])
+    try:
+        update_parameters(m, {parameter: np.tile(np.repeat(values, n), 2)})
+        fluxes = m.get_fluxes_array(states, np.zeros(len(states)))
+        if fluxes.shape != (len(states), len(m.get_rate_names())):
+            return None
+        F = fluxes @ stoichiometric_matrix(m).T
+    except Exception:
+        return None
+    finally:
+        update_parameters(m, {parameter: float(values[0])})
+    dF = (F[: k * n] - F[k * n :]).reshape(k, n, n) / (2 * H[:, :, None])
+    return np.swapaxes(dF, 1, 2)
+
+
+def eigen_spectrum(J: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Eigenvalues, right and left eigenvectors of a stack of Jacobians.
+
+    Modes are sorted slowest first (smallest |Re lambda|). Right eigenvectors are the
+    columns of the second, left eigenvectors the rows of the third array; both are
+    scaled so left @ right is the identity. All points in one batched call.
+    """
+    finite = np.all(np.isfinite(J), axis=(1, 2))
+    n = J.shape[-1]
+    eigenvalues = np.full(J.shape[:2], np.nan, dtype=complex)
+    right = np.full(J.shape, np.nan, dtype=complex)
+    left = np.full(J.shape, np.nan, dtype=complex)
+    if finite.any():
+        lam, V = np.linalg.eig(J[finite])
+        order = np.argsort(np.abs(lam.real), axis=-1, kind="stable")
+        lam = np.take_along_axis(lam, order, axis=-1)
+        V = np.take_along_axis(V, order[:, None, :].repeat(n, axis=1), axis=-1)
+        eigenvalues[finite] = lam
+        right[finite] = V
+        left[finite] = np.linalg.inv(V)
+    return eigenvalues, right, left
+
+
+def participation_factors(right: np.ndarray, left: np.ndarray) -> np.ndarray:
+    """
+    Share of every compound in every mode, shape (points, modes, compounds).
+
+    p[k, i] = |w_k,i v_i,k|, normalised to 1 per mode: the mode's weight on the
+    compound times the compound's weight on the mode.
+    """
+    p = np.abs(left * np.swapaxes(right, -1, -2))
+    return p / p.sum(axis=-1, keepdims=True)
+
+
+def timescale_analysis(
+    m: Model,
+    states: pd.DataFrame,
+    parameter: str = "pfd",
+    n_modes: Optional[int] = 5,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Slowest modes of the model along a steady state scan and the compounds behind them.
+
+    Returns the spectrum, one row per scan point and mode (0 = slowest) with the
+    eigenvalue, its timescale 1 / |Re lambda| (in the model's time unit), the
+    compound with the largest participation and its share; and the participation
+    factors of these modes, one row per scan point and mode, compounds as columns
+    (float32). n_modes=None keeps all modes.
+
+        c, v = pfd_ss_scan(s, np.linspace(50, 1500, 200), y0)
+        spectrum, participation = timescale_analysis(m, c)
+        spectrum.xs(0, level="mode")["timescale"].plot()
+    """
+    compounds = m.get_compounds()
+    eigenvalues, right, left = eigen_spectrum(scan_jacobians(m, states, parameter))
+    P = participation_factors(right, left)
+    if n_modes is not None:
+        eigenvalues, P = eigenvalues[:, :n_modes], P[:, :n_modes]
+    n_points, n = eigenvalues.shape
+    index = pd.MultiIndex.from_product(
+        [states.index, range(n)], names=[states.index.name or parameter, "mode"]
+    )
+    P = P.reshape(n_points * n, -1)
+    finite = np.all(np.isfinite(P), axis=1)
+    top = np.argmax(np.where(finite[:, None], P, 0), axis=1)
+    eigenvalues = eigenvalues.ravel()
+    with np.errstate(divide="ignore"):
+        timescale = 1 / np.abs(eigenvalues.real)
+    spectrum = pd.DataFrame(
+        {
+            "real": eigenvalues.real,
+            "imag": eigenvalues.imag,
+            "timescale": timescale,
+            "dominant": np.where(finite, np.array(compounds, dtype=object)[top], None),
+            "share": np.where(finite, P[np.arange(len(P)), top], np.nan),
+        },
+        index=index,
+    )
+    participation = pd.DataFrame(P.astype(np.float32), index=index, columns=compounds)
+    return spectrum, participation
@@ -0,0 +1,157 @@
+"""
+Stiffness diagnosis from the Jacobian spectrum and solver selection per segment.
+
+    python -m utilities.stiffness --model latest_dev
+
+compares method="auto" with a fixed solver on a short PIRK and PAM sequence.
+"""
+
+from __future__ import annotations
+
+__all__ = ["diagnose", "select_solver", "compare_solvers", "STIFF_THRESHOLD"]
+
+import argparse
+import importlib
+import time
+import warnings
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+
+# fastest decay rate times segment duration above which explicit solvers are hopeless
+STIFF_THRESHOLD = 100.0
+
+
+def diagnose(J: np.ndarray, tol: float = 1e-9) -> Dict[str, Any]:
+    """
+    Time scales of the linearised system.
+
+    Eigenvalues with a real part below tol * fastest rate are treated as zero
+    (conservation laws, very slow pools) and left out of the stiffness ratio.
+    """
+    eigenvalues = np.linalg.eigvals(J)
+    rates = -eigenvalues.real
+    fast = float(rates.max()) if rates.max() > 0 else 0.0
+    decaying = rates[rates > tol * fast] if fast > 0 else rates[:0]
+    slow = float(decaying.min()) if len(decaying) > 0 else np.nan
+    return {
+        "eigenvalues": eigenvalues,
+        "fast_rate": fast,
+        "slow_rate": slow,
+        "stiffness_ratio": fast / slow if len(decaying) > 0 else np.nan,
+        "max_growth_rate": float(max(-rates.min(), 0.0)),
+        "max_imag": float(np.abs(eigenvalues.imag).max()),
+    }
+
+
+def select_solver(J: np.ndarray, duration: float, rtol: float = 1e-8) -> Dict[str, Any]:
+    """
+    Solver for a segment of the given duration with Jacobian J at its start.
+
+    Stiff segments (fastest rate * duration > STIFF_THRESHOLD) get BDF, or Radau if
+    the fast modes oscillate; the others an explicit Runge-Kutta method (DOP853 for
+    rtol below 1e-9). Only the method is chosen, the tolerances stay as they are.
+    The photosynthesis models are stiff in every segment down to the 3 ms PIRK
+    pulses, so for them "auto" picks BDF throughout.
+    """
+    diagnosis = diagnose(J)
+    stiff = diagnosis["fast_rate"] * duration > STIFF_THRESHOLD
+    if stiff:
+        method = "Radau" if diagnosis["max_imag"] > diagnosis["fast_rate"] else "BDF"
+    else:
+        method = "DOP853" if rtol < 1e-9 else "RK45"
+    return {"method": method, "stiff": stiff, **diagnosis}
+
+
+def _run(
+    m: Model,
+    y0: Dict[str, float],
+    protocol: Sequence[Tuple[float, float]],
+    integrator_kwargs: Dict[str, Any],
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    from .simulator import Simulator
+
+    s = Simulator(m)
+    s.initialise(y0)
+    for t_end, pfd in protocol:
+        s.update_parameter("pfd", pfd)
+        t, _ = s.simulate(t_end, **integrator_kwargs)
+        if t is None:
+            break
+    y_end = s.get_new_y0()
+    y_end = np.array([] if y_end is None else list(y_end.values()))
+    return s.get_integrator_stats(), y_end
+
+
+def compare_solvers(
+    m: Model,
+    y0: Dict[str, float],
+    protocol: Sequence[Tuple[float, float]],
+    fixed: Optional[Dict[str, Any]] = None,
+) -> pd.DataFrame:
+    """
+    Per-segment wall time and RHS evaluations of method="auto" against a fixed choice.
+
+    protocol is a list of (t_end, pfd). The last column is the largest relative
+    difference of the final states of the two runs.
+    """
+    if fixed is None:
+        fixed = {"method": "BDF"}
+    auto_stats, auto_y = _run(m, y0, protocol, {"method": "auto"})
+    fixed_stats, fixed_y = _run(m, y0, protocol, fixed)
+    columns = ["method", "nfev", "nsteps", "wall_time"]
+    compared = auto_stats[["t_start", "t_end", "pfd", *columns]].join(
+        fixed_stats[columns], rsuffix="_fixed"
+    )
+    if auto_y.shape == fixed_y.shape and auto_y.size > 0:
+        scale = np.maximum(np.abs(fixed_y), 1e-12)
+        compared.attrs["max_rel_difference"] = float(
+            np.max(np.abs(auto_y - fixed_y) / scale)
+        )
+    return compared
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from .protocols import get_stst_y0
+
+    parser = argparse.ArgumentParser(
+        description="Compare automatic and fixed solver choice"
+    )
+    parser.add_argument("--model", default="latest_dev")
+    parser.add_argument("--fixed", default="BDF")
+    args = parser.parse_args(argv)
+
+    warnings.simplefilter("ignore")
+    m = importlib.import_module(f"models.{args.model}").get_model()
+    y0 = get_stst_y0(m, pfd=100)
+    protocols = {
+        # 10 s pre-illumination, then 4 x (3 ms pulse, 60 ms dark)
+        "PIRK": [(10, 100)]
+        + [
+            (10 + 0.063 * i + dt, pfd)
+            for i in range(4)
+            for dt, pfd in ((0.003, 1000), (0.063, 5))
+        ],
+        # dark relaxation and saturating pulse of the PAM protocol
+        "PAM": [(120, 50), (120.8, 5000), (240.8, 50)],
+    }
+    for name, protocol in protocols.items():
+        start = time.perf_counter()
+        compared = compare_solvers(m, y0, protocol, fixed={"method": args.fixed})
+        print(f"\n{name} ({time.perf_counter() - start:.1f} s)")
+        print(compared.to_string())
+        print(
+            "total wall time auto/fixed:",
+            compared["wall_time"].sum(),
+            compared["wall_time_fixed"].sum(),
+        )
+        print(
+            "max relative difference of final state:",
+            compared.attrs.get("max_rel_difference"),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+from __future__ import annotations
+
+__all__ = [
+    "STEADY_STATE_OUTPUTS",
+    "steady_state_outputs",
+    "GaussianProcess",
+    "SteadyStateSurrogate",
+]
+
+import logging
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from modelbase.ode import Model
+from scipy import linalg, optimize
+from scipy.stats import qmc
+
+from .atlas import SteadyStateAtlas, _solve
+from .events import Extremum
+from .parallel import run_parallel
+from .protocols import Y0
+from .simulator import Simulator
+
+logger = logging.getLogger(__name__)
+
+# steady state read-outs of the parameter studies
+STEADY_STATE_OUTPUTS = ["ATP_norm", "NADP_redoxstate", "NPQ", "rel_P700+"]
+
+
+def _fm(
+    m: Model, y: Dict[str, float], pfd_pulse: float = 5000, t_pulse: float = 0.8
+) -> float:
+    # peak of the model's own Fluo during a saturating pulse from y (as in pam_analysis)
+    s = Simulator(m)
+    s.add_event("Fm", Extremum("Fluo"))
+    s.initialise(y)
+    s.update_parameter("pfd", pfd_pulse)
+    t, _ = s.simulate(t_pulse, store=False)
+    peaks = s.get_events("Fm")
+    peaks = peaks[peaks["kind"] == "max"]
+    if t is None or len(peaks) == 0:
+        return np.nan
+    return float(peaks["Fluo"].max())
+
+
+def steady_state_outputs(
+    m: Model,
+    y_ss: Dict[str, float],
+    outputs: Sequence[str] = STEADY_STATE_OUTPUTS,
+    y_dark: Optional[Dict[str, float]] = None,
+) -> Dict[str, float]:
+    """
+    Outputs (compounds or derived compounds) of m at the steady state y_ss.
+
+    NPQ = Fm / Fm' - 1 with Fm' the peak of the model's Fluo during a saturating
+    pulse (pam_analysis defaults: pfd 5000 for 0.8 s) from y_ss, located by an
+    Extremum event (utilities.events), and Fm the one from the dark adapted steady
+    state y_dark (needed for NPQ only). Works for every model with a Fluo module.
+    """
+    values = m.get_full_concentration_dict(y_ss)
+    result = {}
+    for name in outputs:
+        if name == "NPQ":
+            if y_dark is None:
+                raise ValueError("NPQ needs the dark adapted steady state y_dark")
+            result[name] = _fm(m, y_dark) / _fm(m, y_ss) - 1
+        else:
+            result[name] = float(np.asarray(values[name]).ravel()[0])
+    return result
+
+
+class GaussianProcess:
+    """
+    Gaussian process regression of one output on inputs in the unit cube.
+
+    Matern 5/2 kernel with a length scale per input; signal variance, length scales
+    and noise are fitted by maximising the marginal likelihood (L-BFGS-B, a few
+    restarts). The output is standardised internally.
+    """
+
+    def __init__(self, restarts: int = 3, seed: int = 0) -> None:
+        self.restarts = restarts
+        self.seed = seed
+        self.theta: Optional[np.ndarray] = None
+
+    @staticmethod
+    def _kernel(A: np.ndarray, B: np.ndarray, theta: np.ndarray) -> np.ndarray:
+        scale = np.exp(theta[1:-1])
+        diff = (A[:, None, :] - B[None, :, :]) / scale
+        r = np.sqrt(5 * np.sum(diff**2, axis=-1))
+        return np.exp(theta[0]) * (1 + r + r**2 / 3) * np.exp(-r)
+
+    def _factor(self, theta: np.ndarray) -> Tuple[np.ndarray, bool]:
+        K = self._kernel(self.X, self.X, theta)
+        K[np.diag_indices_from(K)] += np.exp(theta[-1]) + 1e-10
+        return linalg.cho_factor(K, lower=True)
+
+    def _nll(self, theta: np.ndarray) -> float:
+        try:
+            c = self._factor(theta)
+        except linalg.LinAlgError:
+            return 1e10
+        alpha = linalg.cho_solve(c, self.z)
+        return float(0.5 * self.z @ alpha + np.sum(np.log(np.diag(c[0]))))
+
+    def fit(
+        self, X: np.ndarray, y: np.ndarray, optimize_theta: bool = True
+    ) -> "GaussianProcess":
+        """Fit to the rows X and values y; optimize_theta=False keeps the last fit"""
+        self.X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.mean = float(y.mean())
+        self.scale = float(y.std()) or 1.0
+        self.z = (y - self.mean) / self.scale
+        d = self.X.shape[1]
+        if optimize_theta or self.theta is None:
+            bounds = [(-5, 3)] + [(np.log(0.02), np.log(20))] * d + [(-18, -2)]
+            rng = np.random.default_rng(self.seed)
+            starts = [np.r_[0, np.log(0.3) * np.ones(d), -10]]
+            starts += [rng.uniform(*np.array(bounds).T) for _ in range(self.restarts - 1)]
+            fits = [
+                optimize.minimize(self._nll, x0, method="L-BFGS-B", bounds=bounds)
+                for x0 in starts
+            ]
+            self.theta = min(fits, key=lambda f: f.fun).x
+        self._c = self._factor(self.theta)
+        self._alpha = linalg.cho_solve(self._c, self.z)
+        return self
+
+    def predict(self, X: np.ndarray, return_std: bool = False) -> Any:
+        """Mean (and standard deviation) at the rows X"""
+        Ks = self._kernel(np.asarray(X, dtype=float), self.X, self.theta)
+        mean = self.mean + self.scale * (Ks @ self._alpha)
+        if not return_std:
+            return mean
+        v = linalg.solve_triangular(self._c[0], Ks.T, lower=True)
+        var = np.exp(self.theta[0]) - np.sum(v**2, axis=0)
+        return mean, self.scale * np.sqrt(np.maximum(var, 0))
+
+    def loo_residuals(self) -> np.ndarray:
+        """Leave-one-out residuals of the training points, without refitting"""
+        K_inv = linalg.cho_solve(self._c, np.eye(len(self.X)))
+        return self.scale * self._alpha / np.diag(K_inv)
+
+
+class SteadyStateSurrogate:
+    """
+    Emulator of steady state outputs over a box of parameters.
+
+    Trained on steady states of the ODE model (computed in threads, warm started
+    from a SteadyStateAtlas or a reference steady state) with one GaussianProcess
+    per output; parameters in log are scaled logarithmically. Queries cost
+    microseconds per point instead of a steady state computation.
+
+        surrogate = SteadyStateSurrogate(
+            m, {"pfd": (50, 1500), "CO2": (0.1, 0.4), "kcyc": (0.5, 2)}
+        )
+        surrogate.fit(40).refine(target=0.01)
+        surrogate.validate(50)
+        surrogate.predict(pd.DataFrame({"pfd": ..., "CO2": ..., "kcyc": ...}))
+    """
+
+    def __init__(
+        self,
+        model: Model,
+        bounds: Dict[str, Tuple[float, float]],
+        outputs: Sequence[str] = STEADY_STATE_OUTPUTS,
+        log: Sequence[str] = ("pfd",),
+        atlas: Optional[SteadyStateAtlas] = None,
+        y0: Optional[Dict[str, float]] = None,
+        pfd_dark: float = 50,
+        max_workers: Optional[int] = None,
+    ) -> None:
+        self.model = model
+        self.bounds = dict(bounds)
+        self.outputs = list(outputs)
+        self.log = set(log).intersection(self.bounds)
+        self.atlas = atlas
+        self.pfd_dark = pfd_dark
+        self.max_workers = max_workers
+        if y0 is None and atlas is None:
+            # one steady state at the model's parameters to start all others from
+            y0 = _solve(model.copy(), {c: Y0.get(c, 1.0) for c in model.get_compounds()})
+        self.y0 = y0
+        self.parameters = pd.DataFrame(columns=list(self.bounds), dtype=float)
+        self.values = pd.DataFrame(columns=self.outputs, dtype=float)
+        self.processes: Dict[str, GaussianProcess] = {}
+
+    ##########################################################################
+    # ODE model
+    ##########################################################################
+
+    def _start(self, parameters: Dict[str, float]) -> Dict[str, float]:
+        if self.atlas is None:
+            return self.y0
+        return self.atlas.interpolate(
+            **{k: v for k, v in parameters.items() if k in self.atlas.axes}
+        )
+
+    def evaluate(self, parameters: pd.DataFrame) -> pd.DataFrame:
+        """Outputs of the ODE model at every row of parameters (NaN: no steady state)"""
+
+        def outputs(s: Any, row: Dict[str, float]) -> Dict[str, float]:
+            y_dark = None
+            if "NPQ" in self.outputs:
+                s.update_parameters({**row, "pfd": self.pfd_dark})
+                y_dark = _solve(s.model, self._start({**row, "pfd": self.pfd_dark}))
+                if y_dark is None:
+                    return {}
+            s.update_parameters(row)
+            y_ss = _solve(s.model, self._start(row))
+            if y_ss is None:
+                return {}
+            return steady_state_outputs(s.model, y_ss, self.outputs, y_dark)
+
+        rows = parameters[list(self.bounds)].to_dict(orient="records")
+        results = run_parallel(self.model, outputs, rows, max_workers=self.max_workers)
+        return pd.DataFrame(results, index=parameters.index, columns=self.outputs)
+
+    ##########################################################################
+    # Emulator
+    ##########################################################################
+
+    def _unit(self, parameters: pd.DataFrame) -> np.ndarray:
+        columns = []
+        for name, (low, high) in self.bounds.items():
+            x = parameters[name].to_numpy(dtype=float)
+            if name in self.log:
+                x, low, high = np.log(x), np.log(low), np.log(high)
+            columns.append((x - low) / (high - low))
+        return np.column_stack(columns)
+
+    def sample(self, n: int, seed: int = 0) -> pd.DataFrame:
+        """Latin hypercube sample of n parameter sets inside the bounds"""
+        U = qmc.LatinHypercube(d=len(self.bounds), seed=seed).random(n)
+        data = {}
+        for u, (name, (low, high)) in zip(U.T, self.bounds.items()):
+            if name in self.log:
+                data[name] = np.exp(np.log(low) + u * (np.log(high) - np.log(low)))
+            else:
+                data[name] = low + u * (high - low)
+        return pd.DataFrame(data)
+
+    def add(self, parameters: pd.DataFrame, optimize_theta: bool = True) -> pd.DataFrame:
+        """Run the ODE model at parameters, add the results and refit; returns them"""
+        values = self.evaluate(parameters)
+        failed = values.isna().any(axis=1)
+        if failed.any():
+            logger.warning("%d parameter sets without steady state", failed.sum())
+        self.parameters = pd.concat(
+            [self.parameters, parameters[~failed]], ignore_index=True
+        )
+        self.values = pd.concat([self.values, values[~failed]], ignore_index=True)
+        X = self._unit(self.parameters)
+        for name in self.outputs:
+            gp = self.processes.setdefault(name, GaussianProcess())
+            gp.fit(X, self.values[name].to_numpy(dtype=float), optimize_theta)
+        return values
+
+    def fit(self, n: int = 40, seed: int = 0) -> "SteadyStateSurrogate":
+        """Initial training on a Latin hypercube of n points"""
+        self.add(self.sample(n, seed=seed))
+        return self
+
+    def predict(self, parameters: Any, return_std: bool = False) -> Any:
+        """
+        Emulated outputs for parameters (DataFrame or dict of arrays, columns as the
+        bounds); with return_std also their standard deviations.
+        """
+        parameters = pd.DataFrame(parameters)
+        X = self._unit(parameters)
+        mean, std = {}, {}
+        for name, gp in self.processes.items():
+            if return_std:
+                mean[name], std[name] = gp.predict(X, return_std=True)
+            else:
+                mean[name] = gp.predict(X)
+        mean = pd.DataFrame(mean, index=parameters.index)
+        if not return_std:
+            return mean
+        return mean, pd.DataFrame(std, index=parameters.index)
+
+    def loo_error(self) -> pd.DataFrame:
+        """Leave-one-out RMSE and largest error per output, also relative to its range"""
+        rows = {}
+        for name, gp in self.processes.items():
+            r = gp.loo_residuals()
+            span = np.ptp(self.values[name].to_numpy(dtype=float)) or 1.0
+            rmse = float(np.sqrt(np.mean(r**2)))
+            rows[name] = {
+                "rmse": rmse,
+                "max": float(np.max(np.abs(r))),
+                "relative_rmse": rmse / span,
+                "relative_max": float(np.max(np.abs(r))) / span,
+            }
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+    def validate(self, n: int = 50, seed: int = 1) -> pd.DataFrame:
+        """
+        Errors on n fresh ODE runs (Latin hypercube, not used for training):
+        RMSE, largest error, both relative to the output range, and R^2.
+        """
+        parameters = self.sample(n, seed=seed)
+        truth = self.evaluate(parameters).dropna()
+        predicted = self.predict(parameters.loc[truth.index])
+        error = predicted - truth
+        span = truth.max() - truth.min()
+        span[span == 0] = 1.0
+        rmse = np.sqrt((error**2).mean())
+        return pd.DataFrame(
+            {
+                "rmse": rmse,
+                "max": error.abs().max(),
+                "relative_rmse": rmse / span,
+                "relative_max": error.abs().max() / span,
+                "r2": 1 - (error**2).sum() / ((truth - truth.mean()) ** 2).sum(),
+            }
+        )
+
+    def refine(
+        self,
+        target: float = 0.01,
+        batch: int = 10,
+        max_points: int = 200,
+        n_candidates: int = 2000,
+        seed: int = 0,
+    ) -> pd.DataFrame:
+        """
+        Add ODE runs where the emulator is least sure until the leave-one-out
+        relative RMSE of every output is below target or max_points are used.
+
+        Every round picks batch points from a Latin hypercube of candidates, one at
+        a time at the largest summed relative standard deviation; the standard
+        deviation of the remaining candidates is updated for the picked points
+        first (it does not depend on the unknown outputs). Returns the
+        leave-one-out errors per round.
+        """
+        history = []
+        rng = np.random.default_rng(seed)
+        while True:
+            errors = self.loo_error()
+            history.append(errors["relative_rmse"].rename(len(self.parameters)))
+            if errors["relative_rmse"].max() < target:
+                break
+            if len(self.parameters) >= max_points:
+                logger.warning("refine stopped at %d points", len(self.parameters))
+                break
+            candidates = self.sample(n_candidates, seed=int(rng.integers(2**31)))
+            C = self._unit(candidates)
+            X = self._unit(self.parameters)
+            spans = {
+                k: np.ptp(self.values[k].to_numpy(dtype=float)) or 1.0
+                for k in self.outputs
+            }
+            picked = []
+            for _ in range(min(batch, max_points - len(self.parameters))):
+                X_all = np.vstack([X, C[picked]]) if picked else X
+                score = np.zeros(len(C))
+                for name, gp in self.processes.items():
+                    fantasy = GaussianProcess()
+                    fantasy.theta = gp.theta
+                    fantasy.fit(X_all, np.zeros(len(X_all)), optimize_theta=False)
+                    _, std = fantasy.predict(C, return_std=True)
+                    score += gp.scale * std / spans[name]
+                score[picked] = -np.inf
+                picked.append(int(np.argmax(score)))
+            self.add(candidates.iloc[picked].reset_index(drop=True))
+        return pd.DataFrame(history).rename_axis("points")